@@ -14,7 +14,7 @@ python src/bow_mdl.py\
     --verbose 100
 
 python src/signal_extraction.py\
-    --model mdl/da_sample_model.pcl\
+    --model mdl/da_sample_model\
     --window=7
 
 # application example
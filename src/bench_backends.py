@@ -0,0 +1,82 @@
+"""
+Benchmark of the LatentSemantics topic model backends: fit time, peak memory and coherence
+
+Parameters:
+    - dataset: ndjson file with a "text" field
+    - language: language of data using ISO 639-1 (selects the stopword list in res/)
+    - n: number of documents to benchmark on
+    - k: number of topics
+    - backends: backends to compare
+
+EX.
+python src/bench_backends.py --dataset dat/sample.ndjson --language da --n 2000 --k 20 --backends mallet ldamulticore gibbs
+"""
+import argparse
+import os
+import json
+import time
+import resource
+import multiprocessing
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from tekisuto.preprocessing import CaseFolder
+from tekisuto.preprocessing import RegxFilter
+from tekisuto.preprocessing import StopWordFilter
+from tekisuto.preprocessing import Tokenizer
+from tekisuto.preprocessing import CompiledPipeline
+from tekisuto.models import LatentSemantics
+from tekisuto.models.coherence import topic_ids
+
+
+def fit_backend(tokens, k, backend, workers):
+    """ fit in a fresh process, returns fit time, the growth of peak resident memory in MB during
+        the fit (of this process or of its child processes such as the JVM, whichever is larger)
+        and the topic word ids
+    """
+    ls = LatentSemantics(tokens, k=k, workers=workers, backend=backend)
+    ls.build_corpus()
+    # the process already holds the tokens and corpus, only the growth of its peak is the fit's
+    # (children forked during imports report the memory of this process, hence a baseline for them as well)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    tic = time.perf_counter()
+    ls.fit(coherence=False)
+    seconds = time.perf_counter() - tic
+    maxrss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss - children)
+    return seconds, maxrss / 1024., topic_ids(ls.model)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="[INFO] benchmark topic model backends")
+    ap.add_argument("-d", "--dataset", required=True, help="path to input dataset")
+    ap.add_argument("-l", "--language", required=True, help="language of data using ISO 639-1")
+    ap.add_argument("-n", "--n", required=False, type=int, default=2000, help="number of documents")
+    ap.add_argument("-k", "--k", required=False, type=int, default=20, help="number of topics")
+    ap.add_argument("-w", "--workers", required=False, type=int, default=4, help="threads/processes per fit")
+    ap.add_argument("-b", "--backends", required=False, nargs="+", default=["mallet", "ldamulticore", "gibbs"], help="backends to compare")
+    args = vars(ap.parse_args())
+
+    with open(args["dataset"], "r") as fobj:
+        docs = [json.loads(ligne)["text"] for ligne in islice(fobj, args["n"])]
+    pipeline = CompiledPipeline([
+        RegxFilter(pattern=r"\W+"),
+        RegxFilter(pattern=r"\d+"),
+        StopWordFilter(path=os.path.join("res", "stopwords-{}.txt".format(args["language"]))),
+        CaseFolder(lower=True),
+        ], tokenizer=Tokenizer())
+    tokens = pipeline.doctokenizer(docs)
+
+    # every backend is scored from the same co-occurrence counts
+    ls = LatentSemantics(tokens, k=args["k"])
+    scorer = ls.coherence_scorer()
+
+    print("[INFO] {:<14} {:>10} {:>12} {:>10}".format("backend", "fit (sec)", "+maxrss (MB)", "c_v"))
+    for backend in args["backends"]:
+        # spawned rather than forked, so the child does not start with the memory of this process
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            seconds, maxrss, topics = pool.submit(fit_backend, tokens, args["k"], backend, args["workers"]).result()
+        print("[INFO] {:<14} {:>10.2f} {:>12.1f} {:>10.4f}".format(backend, seconds, maxrss, scorer.score(topics)))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the compiled preprocessing pipeline against the preprocessor chain
+
+Parameters:
+    - dataset: ndjson file with a "text" field
+    - language: language of data using ISO 639-1 (selects the stopword list in res/)
+    - n: number of documents to benchmark on
+
+EX.
+python src/bench_preprocessing.py --dataset dat/sample.ndjson --language da --n 1000
+"""
+import argparse
+import os
+import json
+import time
+from itertools import islice
+
+from tekisuto.preprocessing import CaseFolder
+from tekisuto.preprocessing import RegxFilter
+from tekisuto.preprocessing import StopWordFilter
+from tekisuto.preprocessing import Tokenizer
+from tekisuto.preprocessing import CompiledPipeline
+
+
+def run_chain(docs, preprocessors, tokenizer):
+    out = list()
+    for text in docs:
+        for p in preprocessors:
+            text = p.preprocess(text)
+        out.append(text)
+    return tokenizer.doctokenizer(out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="[INFO] benchmark compiled preprocessing against the preprocessor chain")
+    ap.add_argument("-d", "--dataset", required=True, help="path to input dataset")
+    ap.add_argument("-l", "--language", required=True, help="language of data using ISO 639-1")
+    ap.add_argument("-n", "--n", required=False, type=int, default=1000, help="number of documents")
+    ap.add_argument("-r", "--repeat", required=False, type=int, default=3, help="number of timed runs, best is reported")
+    args = vars(ap.parse_args())
+
+    with open(args["dataset"], "r") as fobj:
+        docs = [json.loads(ligne)["text"] for ligne in islice(fobj, args["n"])]
+
+    # the chain of bow_mdl.py without the lemmatizer, which costs the same in both modes
+    preprocessors = [
+        RegxFilter(pattern=r"\W+"),
+        RegxFilter(pattern=r"\d+"),
+        StopWordFilter(path=os.path.join("res", "stopwords-{}.txt".format(args["language"]))),
+        CaseFolder(lower=True),
+        ]
+    tokenizer = Tokenizer()
+    pipeline = CompiledPipeline(preprocessors, tokenizer=tokenizer)
+
+    timings = dict()
+    for name, fun in [("chain", lambda: run_chain(docs, preprocessors, tokenizer)), ("compiled", lambda: pipeline.doctokenizer(docs))]:
+        best = float("inf")
+        for _ in range(args["repeat"]):
+            tic = time.perf_counter()
+            out = fun()
+            best = min(best, time.perf_counter() - tic)
+        timings[name] = (best, out)
+        print("[INFO] {:<8} {:.3f} sec for {} documents".format(name, best, len(docs)))
+
+    assert timings["chain"][1] == timings["compiled"][1], "compiled pipeline output differs from chain"
+    print("[INFO] identical tokens, speedup {:.1f}x".format(timings["chain"][0] / timings["compiled"][0]))
+
+if __name__=="__main__":
+    main()
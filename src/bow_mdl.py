@@ -9,6 +9,8 @@ Parameters:
     - estimate: string, "start stop step", range for k number of latent variables grid search
     - sourcename
     - verbose
+    - update: add the dataset (e.g. one day of articles) to the stored model
+    - sample: train on a date stratified sample of this many documents, theta is inferred for all
 
 EX.
 python bow_mdl.py --dataset ../dat/sample.ndjson --language da --bytestore 100 --estimate "20 50 10" --sourcename politiken --verbose 100
@@ -20,17 +22,26 @@ In case of non-probabilistic representations, the divergence/distance measure ha
 import argparse
 import os
 import json
-import pickle
+import shutil
+import time
 
+import numpy as np
 import spacy
 
 from tekisuto.datasets import DatasetLoaderNdjson
+from tekisuto.datasets import PreprocessingCache
 from tekisuto.preprocessing import CaseFolder
 from tekisuto.preprocessing import RegxFilter
 from tekisuto.preprocessing import StopWordFilter
 from tekisuto.preprocessing import Lemmatizer, LemmatizerSpacy
 from tekisuto.preprocessing import Tokenizer
+from tekisuto.preprocessing import CompiledPipeline
+from tekisuto.preprocessing import LemmaMemo
 from tekisuto.models import LatentSemantics
+from tekisuto.models.inference import infer_theta
+from tekisuto.models.artifact import ModelArtifact, CORPUS
+from tekisuto.models.sampling import stratified_sample, compare_signals
+from tekisuto.tekiutil import dates_to_epoch, BUCKETS
 
 lemmatizers = {"stanza": Lemmatizer, "spacy": LemmatizerSpacy}
 
@@ -39,13 +50,38 @@ def main():
     ap = argparse.ArgumentParser(description="[INFO] this is a required preprocessing program for training an newspaper uncertainty model")
     ap.add_argument("-d", "--dataset", required=True, help="path to input dataset")
     ap.add_argument("-l", "--language", required=True, help="language of data using ISO 639-1")
-    ap.add_argument("-b", "--bytestore", required=False, type=int, default=250, help="frequency for dataloader backup, -1 to deactivate")
+    ap.add_argument("-b", "--bytestore", required=False, type=int, default=250, help="frequency for dataloader checkpoints, -1 to deactivate")
+    ap.add_argument("--sortbuffer", required=False, type=int, default=None, help="number of documents to date sort in memory, larger datasets are sorted on disk")
+    ap.add_argument("-w", "--workers", required=False, type=int, default=1, help="number of preprocessing processes")
+    ap.add_argument("--chunksize", required=False, type=int, default=64, help="number of documents sent to a preprocessing process at a time")
+    ap.add_argument("-c", "--cache", required=False, default=None, help="path to cache of preprocessed documents, shared between runs")
+    ap.add_argument("--cachesize", required=False, type=int, default=4096, help="maximum size of the preprocessing cache in MB")
+    ap.add_argument("--lemmamemo", required=False, default=None, help="path to word form to lemma table, enables fast lemmatization and is updated after the run")
+    ap.add_argument("--cores", required=False, type=int, default=None, help="total number of cores for the k grid search, default all")
+    ap.add_argument("--strategy", required=False, default="grid", help="search over the k grid: grid, golden, halving or early")
+    ap.add_argument("--backend", required=False, default="mallet", help="topic model backend: mallet, ldamulticore, lda or gibbs")
+    ap.add_argument("-u", "--update", required=False, action="store_true", help="add the dataset to the stored model of sourcename instead of training from scratch")
+    ap.add_argument("--hashing", required=False, type=int, default=None, help="hash words to this many ids, so later updates have no out-of-vocabulary words (lda and ldamulticore backends), also the ids of --vocabulary hash")
+    ap.add_argument("--vocabulary", required=False, default="exact", help="exact, sketch (approximate pre-pass decides the counted words) or hash vocabulary")
+    ap.add_argument("--memory", required=False, type=int, default=1024, help="memory for the sketch vocabulary in MB")
+    ap.add_argument("--no_below", required=False, type=int, default=None, help="keep words in at least this many documents, also the words the sketch vocabulary counts exactly")
+    ap.add_argument("--no_above", required=False, type=float, default=None, help="keep words in at most this fraction of the documents")
+    ap.add_argument("--keep_n", required=False, type=int, default=None, help="keep only this many most frequent words")
+    ap.add_argument("--drift", required=False, type=float, default=0.05, help="topic drift (mean JSD) above which an update retrains on all documents")
+    ap.add_argument("--sample", required=False, type=int, default=None, help="train on a sample of this many documents, stratified by date bucket")
+    ap.add_argument("--sampletokens", required=False, type=int, default=None, help="train on a stratified sample of about this many tokens (instead of --sample)")
+    ap.add_argument("--bucket", required=False, default="month", choices=BUCKETS, help="date bucket of the sample strata")
+    ap.add_argument("--compare", required=False, action="store_true", help="also fit the full corpus and report the coherence and signal loss of the sample")
+    ap.add_argument("--window", required=False, type=int, default=3, help="window of the signal compared by --compare, as passed to signal_extraction.py")
+    ap.add_argument("--unit", required=False, default=None, choices=BUCKETS, help="calendar unit of the window compared by --compare, as passed to signal_extraction.py")
     ap.add_argument("-e", "--estimate", required=False, help="estimation mode")
     ap.add_argument("-n", "--sourcename", required=False, default="noname", help="name of the newspaper")
     ap.add_argument("-m", "--model", required=False, default="spacy", help="The model to use in the preprocessing.")
     ap.add_argument("-s", "--spacymodel", required=False, default=None, help="The specific spacy model to use")
     ap.add_argument("-v", "--verbose", required=False, type=int, default=-1, help="verbose mode (number of object to print), -1 to deactivate")
     args = vars(ap.parse_args())
+    if args["vocabulary"] == "sketch" and args["hashing"] is not None:
+        ap.error("--hashing replaces the sketch vocabulary, use one of them")
 
     # import and preprocess data
     print("\n[INFO] preparing training data ...\n")
@@ -55,37 +91,104 @@ def main():
     sw = StopWordFilter(path=os.path.join("res", "stopwords-{}.txt".format(args["language"])))
     #sw = StopWordFilter(language="danish")# using NLTK's stopwords
 
+    memo = None
+    if args["lemmamemo"]:
+        memo = LemmaMemo()
+        if os.path.isfile(args["lemmamemo"]):
+            memo.load(args["lemmamemo"])
     lemmatizer = lemmatizers[args["model"]]
     if args["spacymodel"] is None:
-        le = lemmatizer(lang=args["language"])
+        le = lemmatizer(lang=args["language"], memo=memo)
     else:
         nlp = spacy.load(args["spacymodel"])
-        le = lemmatizer(lang=args["language"], nlp = nlp)
-    dl = DatasetLoaderNdjson(preprocessors=[re0,re1,sw,le,cf])
-    data, _, dates = dl.load(args["dataset"], datesort=True, verbose=args["verbose"], bytestore=args["bytestore"])
-
-    # clean up byte stream backup storage from dataloader
-    if os.path.isfile("dataloader_bytestorage.pcl"):
-        os.remove("dataloader_bytestorage.pcl")
+        le = lemmatizer(lang=args["language"], nlp = nlp, memo=memo)
+    cache = None
+    if args["cache"]:
+        cache = PreprocessingCache(args["cache"], maxsize=args["cachesize"] * 2 ** 20)
+    dl = DatasetLoaderNdjson(preprocessors=[CompiledPipeline([re0,re1,sw,le,cf])])
+    data, _, dates = dl.load(args["dataset"], datesort=True, verbose=args["verbose"], bytestore=args["bytestore"], fields=("text", "date"), sortbuffer=args["sortbuffer"], workers=args["workers"], chunksize=args["chunksize"], cache=cache)
+    if cache is not None:
+        print("[INFO] preprocessing cache: {hits} hits, {misses} misses ({total_hits} hits, {total_misses} misses over all runs)".format(**cache.stats()))
+        cache.close()
+    if memo is not None:
+        # with --workers > 1 the tables learned in the worker processes are merged into memo
+        print("[INFO] lemma memo resolved {:.1f}% of word forms".format(100 * memo.hitrate()))
+        memo.save(args["lemmamemo"])
+
+    # clean up checkpoints from dataloader, a crashed run resumes from them
+    if os.path.isdir("dataloader_checkpoint"):
+        shutil.rmtree("dataloader_checkpoint")
 
     # model training
     print("\n[INFO] training model...\n")
     to = Tokenizer()
-    tokens = to.doctokenizer(data)
-    # parameter estimation
-    if args["estimate"]:
-        print("[INFO] estimating k number of latent variables...")
-        print(args["estimate"])
-        grid = [int(i) for i in args["estimate"].split()]
-        print(grid)
-        ls = LatentSemantics(tokens)
-        k, _ = ls.coherence_k(krange=list(range(grid[0],grid[1],grid[2])))
-        print("[INFO] optimal number of topics: {}".format(k))
-        ls = LatentSemantics(tokens, k=k)# TODO: store models
-    # defalut value
+    tokens = to.doccorpus(data)
+    del data
+    model_path = os.path.join("mdl", "{}_{}_model".format(args["language"], args["sourcename"]))
+    # utc offsets are kept, signals are written with the offsets of the source
+    dates, offsets = dates_to_epoch(dates, offsets=True)
+    theta = None
+    if args["update"]:
+        # incremental mode, the documents of dataset are added to the stored model
+        print("[INFO] updating {}...".format(model_path))
+        artifact = ModelArtifact(model_path)
+        # the stored model decides the backend, not --backend
+        backend = artifact.manifest.get("backend", args["backend"])
+        ls = LatentSemantics(tokens, k=artifact.manifest["k"], backend=backend)
+        ls.model, ls.id2word, ls.corpus = artifact.model(), artifact.id2word(), artifact.corpus()
+        new_theta, retrained = ls.update(tokens, max_drift=args["drift"])
+        old_dates = artifact.dates()
+        if len(dates) and len(old_dates) and dates.min() < old_dates[-1]:
+            print("[INFO] warning: new documents are older than the stored ones, signals assume date order")
+        dates = np.concatenate([old_dates, dates])
+        old_offsets = artifact.offsets()
+        offsets = None if old_offsets is None else np.concatenate([old_offsets, offsets])
+        if not retrained:
+            theta = np.vstack([artifact.theta(), new_theta])
     else:
-        ls = LatentSemantics(tokens, k=25)# change to your preferred default value
-    ls.fit()
+        # dictionary and bow corpus, built once and read from disk by all fits
+        ls = LatentSemantics(tokens, k=25, backend=args["backend"])# change to your preferred default value
+        ls.build_corpus(path=os.path.join(model_path, CORPUS), no_below=args["no_below"], no_above=args["no_above"], keep_n=args["keep_n"],
+                        hashing=args["hashing"], vocabulary=args["vocabulary"], memory=args["memory"] * 2 ** 20)
+        # co-occurrence index next to the on-disk corpus, shared by every coherence score of the run
+        ls.coherence_scorer(path=os.path.join(model_path, "coherence"))
+        # parameter estimation
+        if args["estimate"]:
+            print("[INFO] estimating k number of latent variables...")
+            print(args["estimate"])
+            grid = [int(i) for i in args["estimate"].split()]
+            print(grid)
+            k, _ = ls.coherence_k(krange=list(range(grid[0],grid[1],grid[2])), cores=args["cores"], strategy=args["strategy"])
+            print("[INFO] optimal number of topics: {}".format(k))
+            ls.k = k
+        sample = None
+        if args["sample"] or args["sampletokens"]:
+            sample = stratified_sample(dates, budget_docs=args["sample"], budget_tokens=args["sampletokens"],
+                                       lengths=[len(doc) for doc in tokens], bucket=args["bucket"], offsets=offsets)
+            print("[INFO] training on {} of {} documents".format(len(sample), len(dates)))
+        start = time.time()
+        ls.fit(sample=sample)
+        fit_time = time.time() - start
+        if args["compare"] and sample is not None:
+            # same dictionary, corpus and coherence counts, only the training documents differ
+            print("[INFO] fitting the full corpus for comparison...")
+            full = LatentSemantics(tokens, k=ls.k, backend=args["backend"])
+            full.id2word, full.corpus, full.scorer = ls.id2word, ls.corpus, ls.scorer
+            start = time.time()
+            full.fit()
+            full_time = time.time() - start
+            theta = infer_theta(ls.model, ls.corpus, workers=args["workers"], verbose=args["verbose"])
+            report = compare_signals(theta, infer_theta(full.model, full.corpus, workers=args["workers"]),
+                                     window=args["window"], time=dates, unit=args["unit"], offsets=offsets)
+            report.update({
+                "window": args["window"], "unit": args["unit"],
+                "sample_docs": int(len(sample)), "docs": int(len(dates)),
+                "sample_fit_seconds": fit_time, "full_fit_seconds": full_time,
+                "sample_coherence": float(ls.coherence), "full_coherence": float(full.coherence),
+                })
+            print("[INFO] sample vs full corpus: {}".format(json.dumps(report, indent=2)))
+            with open(os.path.join("mdl", "{}_{}_sample_report.json".format(args["language"], args["sourcename"])), "w") as f:
+                json.dump(report, f, indent=2)
 
     # static semantic content for model summary
     print("\n[INFO] writing content to file...\n")
@@ -94,24 +197,14 @@ def main():
             f.write("{}\n\n".format(topic))
 
     # theta-based representation
-    print("\n[INFO] predicting \u03B8...\n")
-    theta = list()
-    for i, doc in enumerate(ls.corpus):
-        vector = [x[1] for x in ls.model[doc]]
-        theta.append(vector)
-        if args["verbose"] > 0 and i > 0 and (i + 1) % args["verbose"] == 0:
-            print("[INFO] processed {}/{}".format(i + 1, len(data)))
+    if theta is None:
+        print("\n[INFO] predicting \u03B8...\n")
+        theta = infer_theta(ls.model, ls.corpus, workers=args["workers"], verbose=args["verbose"])
 
     # serialize model
-    print("[INFO] exporting model...")
-    out = dict()
-    out["model"] = ls.model
-    out["id2word"] = ls.id2word
-    out["corpus"] = ls.corpus
-    out["theta"] = theta
-    out["dates"] = dates
-    with open(os.path.join("mdl", "{}_{}_model.pcl".format(args["language"], args["sourcename"])), "wb") as f:
-        pickle.dump(out, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print("[INFO] exporting model to {}...".format(model_path))
+    ModelArtifact.write(model_path, theta, dates, model=ls.model, id2word=ls.id2word, corpus=ls.corpus, offsets=offsets,
+                        language=args["language"], source=args["sourcename"], backend=ls.backend)
 
 if __name__=="__main__":
     main()
@@ -8,7 +8,6 @@ python src/main_extractor.py
 """
 
 import os
-import pickle
 
 import pandas as pd
 import spacy
@@ -17,8 +16,10 @@ from tekisuto.preprocessing import CaseFolder
 from tekisuto.preprocessing import RegxFilter
 from tekisuto.preprocessing import StopWordFilter
 from tekisuto.preprocessing import Tokenizer
+from tekisuto.preprocessing import CompiledPipeline
 from tekisuto.models import TopicModel
 from tekisuto.models import InfoDynamics
+from tekisuto.models.artifact import ModelArtifact
 from tekisuto.metrics import jsd
 
 def spacy_lemmatize(texts, nlp, **kwargs):
@@ -43,10 +44,8 @@ def preprocess_for_topic_models(lemmas: list, lang="da"):
         if lang == "en":
             lang = "english"
         sw = StopWordFilter(lang)
-    processors = [cf, re0, re1, sw]
-    for processor in processors:
-        lemmas = [processor.preprocess(t) for t in lemmas]
-    return lemmas
+    pipeline = CompiledPipeline([cf, re0, re1, sw])
+    return [pipeline.preprocess(t) for t in lemmas]
 
 
 def train_topic_model(tokens, 
@@ -67,7 +66,7 @@ def train_topic_model(tokens,
             ntopics=tune_topic_range,
             plot_topics=plot_topics)
         print(f"\n[INFO] Optimal number of topics is {n}")
-        tm = TopicModel(tokens)
+        # same TopicModel, the phrase model of the search is reused
         tm.fit(n, **kwargs)
     else:
         tm = TopicModel(tokens)
@@ -78,9 +77,7 @@ def train_topic_model(tokens,
 
 def extract_novelty_resonance(df, theta, dates, window):
     idmdl = InfoDynamics(data = theta, time = dates, window = window)
-    idmdl.novelty(meas = jsd)
-    idmdl.transience(meas = jsd)
-    idmdl.resonance(meas = jsd)
+    idmdl.fit(meas = jsd)
 
     df["novelty"] = idmdl.nsignal
     df["transience"] = idmdl.tsignal
@@ -123,7 +120,8 @@ if __name__ == '__main__':
     # model training
     print("\n[INFO] training model...\n")
     to = Tokenizer()
-    tokens = to.doctokenizer(lemmas)
+    tokens = to.doccorpus(lemmas)
+    del lemmas
     tm, n = train_topic_model(tokens,
                            ESTIMATE_TOPIPCS,
                            TOPIC_TUNE,
@@ -134,16 +132,10 @@ if __name__ == '__main__':
     print("\n[INFO] Getting topic distribution per document...")
     theta = tm.get_topic_distribution()
     
-    out = dict()
-    out["model"] = tm.model
-    out["id2word"] = tm.dictionary
-    out["tokenlists"] = tm.tokenlists
-    out["theta"] = theta
-    out["dates"] = df['date'].tolist()
-    with open(os.path.join("mdl", "speech_topic_dist.pcl"), "wb") as f:
-        pickle.dump(out, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-    df['theta'] = theta
+    ModelArtifact.write(os.path.join("mdl", "speech_topic_model"), theta, df['date'].tolist(),
+                        model=tm.model, id2word=tm.dictionary, corpus=tm.bows)
+
+    df['theta'] = theta.tolist()
     ### Extract novelty and resonance
     dates = df["date"].tolist()
     # instantiate and call
@@ -3,68 +3,96 @@
 Driver for extracting the uncertainty model, i.e. time-dependent signal from probabilistic bag-of-words representation representation of newspaper dataset
 
 Parameters:
-    - model path to model trained with bow_mdl.py
-    - window: int, window to compute novelty and resonance over (for newspapers 7 days)
+    - model path to model artifact directory trained with bow_mdl.py (or a legacy *_model.pcl)
+    - window: int, window to compute novelty and resonance over (for newspapers 7 days),
+      several windows (e.g. -w 3 7 14 28) are computed in one pass and written to one file each
+    - unit: day, week, month or year, average theta per calendar bin and count windows in these units,
+      bins follow the local calendar of the source dates and are written without a utc offset
+    - aggregate: mean or length (token-weighted mean) of the documents of a bin
 """
 import argparse
 import os
-import pickle
 import newlinejson
 import re
+import numpy as np
 from tekisuto.models import InfoDynamics
+from tekisuto.models.artifact import load_signal_input, ModelArtifact
 from tekisuto.metrics import jsd
+from tekisuto.tekiutil import epoch_to_dates, BUCKETS, NAIVE
+
+def value(x):
+    """ signal value as a json number, null for the NaN of empty calendar bins (NaN is not valid json)
+    """
+    return float(x) if np.isfinite(x) else None
 
 def main():
     # input
     print(os.getcwd())
     ap = argparse.ArgumentParser(description="[INFO] signal extraction for the uncertainty model")
-    ap.add_argument("-m", "--model", required=True, help="path to serialized input model")
-    ap.add_argument("-w", "--window", required=False, type=int, default=3, help="window to compute novelty and resonance over")
+    ap.add_argument("-m", "--model", required=True, help="path to model artifact directory (or legacy pickle)")
+    ap.add_argument("-w", "--window", required=False, type=int, nargs="+", default=[3], help="window(s) to compute novelty and resonance over")
+    ap.add_argument("-u", "--unit", required=False, default=None, choices=BUCKETS, help="calendar unit of the window, default documents")
+    ap.add_argument("-a", "--aggregate", required=False, default="mean", choices=("mean", "length"), help="mean or token length-weighted mean of the documents of a calendar bin")
     args = vars(ap.parse_args())
 
     # import data
     print("[INFO] reading model...")
-    with open(args["model"], "rb") as fobj:
-        mdl = pickle.load(fobj)
-    theta = mdl["theta"]
-    time = mdl["dates"]
+    # only theta and dates are read, memory-mapped for artifacts
+    theta, epoch, offsets = load_signal_input(args["model"])
+    lengths = None
+    if args["unit"] is not None and args["aggregate"] == "length":
+        # token counts from the bag-of-words corpus of the artifact
+        if not os.path.isdir(args["model"]):
+            raise ValueError("--aggregate length needs a model artifact directory with a corpus (retrain {} with bow_mdl.py)".format(args["model"]))
+        lengths = [sum(count for _, count in doc) for doc in ModelArtifact(args["model"]).corpus()]
     
     # instantiate and call
     print("[INFO] extracting signal...")
-    idmdl = InfoDynamics(data = theta, time = time, window = args["window"])
-    idmdl.novelty(meas = jsd)
-    idmdl.transience(meas = jsd)
-    idmdl.resonance(meas = jsd)
+    windows = args["window"]
+    if args["unit"] is None:
+        # dates with the utc offsets of the source (UTC for artifacts without offsets)
+        time = epoch_to_dates(epoch, offsets)
+        idmdl = InfoDynamics(data = theta, time = time, window = windows)
+    else:
+        idmdl = InfoDynamics(data = theta, time = epoch, window = windows, unit = args["unit"], lengths = lengths, offsets = offsets)
+        # bins start at local midnight, which has no single utc offset (e.g. across daylight saving time)
+        time = epoch_to_dates(idmdl.time, None if offsets is None else NAIVE)
+        print("[INFO] {} documents in {} {} bins ({} empty)".format(len(epoch), idmdl.m, args["unit"], int((idmdl.counts == 0).sum())))
+    idmdl.fit(meas = jsd)
     
-    # export to ndjson
-    fname =  os.path.join(
-        "mdl", re.sub(
-            "model.pcl", "signal.json", format(
-                os.path.basename(args["model"])
+    for j, window in enumerate(windows):
+        # export to ndjson, one file per window if there are several
+        suffix = "signal.json" if len(windows) == 1 else "signal_w{}.json".format(window)
+        fname =  os.path.join(
+            "mdl", re.sub(
+                "model(\\.pcl)?$", suffix, format(
+                    os.path.basename(os.path.normpath(args["model"]))
+                )
             )
         )
-    )
 
-    if os.path.isfile(fname):
-        pass
-    else:
-        os.mknod(fname)
-    print("[INFO] exporting signal to {}".format(fname))
-    
-    lignes = list()
-    for i, date in enumerate(time):
-        d = dict()
-        d["date"] = date
-        d["novelty"] = idmdl.nsignal[i] 
-        d["transience"] = idmdl.tsignal[i]
-        d["resonance"] = idmdl.rsignal[i]
-        d["nsigma"] = idmdl.nsigma[i]
-        d["tsigma"] = idmdl.tsigma[i]
-        d["rsigma"] = idmdl.rsigma[i]
-        lignes.append(d)
-    
-    with open(fname, "r+") as f:
-        newlinejson.dump(lignes, f)
+        if os.path.isfile(fname):
+            pass
+        else:
+            os.mknod(fname)
+        print("[INFO] exporting signal to {}".format(fname))
+        
+        lignes = list()
+        for i, date in enumerate(time):
+            d = dict()
+            d["date"] = date
+            d["novelty"] = value(idmdl.nsignal[j, i])
+            d["transience"] = value(idmdl.tsignal[j, i])
+            d["resonance"] = value(idmdl.rsignal[j, i])
+            d["nsigma"] = value(idmdl.nsigma[j, i])
+            d["tsigma"] = value(idmdl.tsigma[j, i])
+            d["rsigma"] = value(idmdl.rsigma[j, i])
+            if idmdl.counts is not None:
+                d["documents"] = int(idmdl.counts[i])
+            lignes.append(d)
+        
+        with open(fname, "r+") as f:
+            newlinejson.dump(lignes, f)
         
 if __name__=="__main__":
     main()
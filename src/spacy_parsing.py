@@ -1,15 +1,28 @@
 """
 """
+import os
+import json
+
+import numpy as np
+
+# token level columns, the rest is noun chunk level
+TOKEN_COLUMNS = ["sent_id", "token", "token_character_span", "lemma", "pos", "dep", "ner"]
+CHUNK_COLUMNS = ["noun_chunk", "noun_chunk_token_span"]
+STRING_COLUMNS = ["token", "lemma", "pos", "dep", "ner", "noun_chunk"]
+SPAN_COLUMNS = ["token_character_span", "noun_chunk_token_span"]
 
 
 def spacy_preprocess(texts: list,
-                     nlp, **kwargs
+                     nlp, outdir=None, shardsize=10000, **kwargs
                      ):
     """
     >>> nlp = spacy.load('da_core_news_lg', disable=["textcat"])
     >>> res = spacy_preprocess(
             texts = ["dette er en test text med et navn, nemlig Lasse Hansen"],
             nlp=nlp)
+
+    With outdir the features are streamed to columnar shards of shardsize
+    documents instead of being returned, see write_shards and SpacyShards.
     """
     docs = nlp.pipe(texts, **kwargs)
 
@@ -39,7 +52,129 @@ def spacy_preprocess(texts: list,
                 doc_features["noun_chunk_token_span"].append(
                     (nc.start, nc.end))
         return doc_features
-    return [__extract_spacy(doc) for doc in docs]
+
+    features = (__extract_spacy(doc) for doc in docs)
+    if outdir is not None:
+        return write_shards(features, outdir, shardsize=shardsize)
+    return list(features)
+
+
+def _write_shard(path, features):
+    """ write one shard of document features as one .npy file per column
+        - strings are interned to int32 ids into the shard's strings.json
+        - token_offsets/chunk_offsets give the rows of document i as offsets[i]:offsets[i+1]
+    """
+    os.makedirs(path, exist_ok=True)
+    strings = dict()
+
+    def intern(s):
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    columns = {name: list() for name in TOKEN_COLUMNS + CHUNK_COLUMNS}
+    token_offsets = [0]
+    chunk_offsets = [0]
+    for doc_features in features:
+        for name in TOKEN_COLUMNS + CHUNK_COLUMNS:
+            values = doc_features[name]
+            if name in STRING_COLUMNS:
+                values = [intern(s) for s in values]
+            columns[name].extend(values)
+        token_offsets.append(len(columns["token"]))
+        chunk_offsets.append(len(columns["noun_chunk"]))
+
+    for name, values in columns.items():
+        shape = (len(values), 2) if name in SPAN_COLUMNS else (len(values),)
+        np.save(os.path.join(path, name + ".npy"), np.array(values, dtype=np.int32).reshape(shape))
+    np.save(os.path.join(path, "token_offsets.npy"), np.array(token_offsets, dtype=np.int64))
+    np.save(os.path.join(path, "chunk_offsets.npy"), np.array(chunk_offsets, dtype=np.int64))
+    with open(os.path.join(path, "strings.json"), "w") as f:
+        json.dump(sorted(strings, key=strings.get), f)
+    return len(token_offsets) - 1
+
+
+def write_shards(features, outdir, shardsize=10000):
+    """ stream document features (as returned by spacy_preprocess) to fixed-size columnar shards
+        - returns the path of the manifest
+    """
+    os.makedirs(outdir, exist_ok=True)
+    shards = list()
+    n = 0
+    batch = list()
+
+    def flush():
+        name = "shard-{:05d}".format(len(shards))
+        shards.append({"name": name, "n_docs": _write_shard(os.path.join(outdir, name), batch)})
+        del batch[:]
+
+    for doc_features in features:
+        batch.append(doc_features)
+        n += 1
+        if len(batch) == shardsize:
+            flush()
+    if batch:
+        flush()
+
+    manifest = os.path.join(outdir, "manifest.json")
+    with open(manifest, "w") as f:
+        json.dump({"n_docs": n, "columns": TOKEN_COLUMNS + CHUNK_COLUMNS, "shards": shards}, f)
+    return manifest
+
+
+class SpacyShards:
+    def __init__(self, outdir):
+        """ memory-mapped reader for shards written by write_shards
+        """
+        self.outdir = outdir
+        with open(os.path.join(outdir, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+
+    def __len__(self):
+        return self.manifest["n_docs"]
+
+    def _load(self, shard, name):
+        return np.load(os.path.join(self.outdir, shard["name"], name + ".npy"), mmap_mode="r")
+
+    def column(self, name):
+        """ generator of the values of one column per document, only that column is read
+            - string columns yield lists of str, span columns lists of (start, end), sent_id lists of int
+        """
+        offsets_name = "chunk_offsets" if name in CHUNK_COLUMNS else "token_offsets"
+        for shard in self.manifest["shards"]:
+            values = self._load(shard, name)
+            offsets = self._load(shard, offsets_name)
+            strings = None
+            if name in STRING_COLUMNS:
+                with open(os.path.join(self.outdir, shard["name"], "strings.json"), "r") as f:
+                    strings = json.load(f)
+            for i in range(shard["n_docs"]):
+                rows = values[offsets[i]:offsets[i + 1]]
+                if strings is not None:
+                    yield [strings[j] for j in rows]
+                elif name in SPAN_COLUMNS:
+                    yield [tuple(span) for span in rows.tolist()]
+                else:
+                    yield rows.tolist()
+
+    def ids(self, name):
+        """ generator of (shard string table, int32 id array) per document for a string column, without decoding
+        """
+        offsets_name = "chunk_offsets" if name in CHUNK_COLUMNS else "token_offsets"
+        for shard in self.manifest["shards"]:
+            values = self._load(shard, name)
+            offsets = self._load(shard, offsets_name)
+            with open(os.path.join(self.outdir, shard["name"], "strings.json"), "r") as f:
+                strings = json.load(f)
+            for i in range(shard["n_docs"]):
+                yield strings, values[offsets[i]:offsets[i + 1]]
+
+    def docs(self):
+        """ generator of per document feature dicts as returned by spacy_preprocess
+        """
+        columns = [self.column(name) for name in TOKEN_COLUMNS + CHUNK_COLUMNS]
+        for values in zip(*columns):
+            yield dict(zip(TOKEN_COLUMNS + CHUNK_COLUMNS, values))
 
 
 if __name__ == "__main__":
@@ -1,3 +1,6 @@
 from .datasetloader import DatasetLoader
 from .datasetloadertable import DatasetLoaderTable
-from .dsloaderndjson import DatasetLoaderNdjson
\ No newline at end of file
+from .dsloaderndjson import DatasetLoaderNdjson
+from .preprocessingpool import PreprocessingPool
+from .cache import PreprocessingCache
+from .tokencorpus import TokenCorpus
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Persistent content-addressed cache of preprocessed documents
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+def chain_fingerprint(preprocessors):
+    """ fingerprint of a preprocessor chain, changes whenever a preprocessor, its settings, or its resources change
+    """
+    parts = list()
+    for p in preprocessors:
+        if not hasattr(p, "fingerprint"):
+            raise ValueError("{} has no fingerprint() and cannot be cached".format(type(p).__name__))
+        parts.append(p.fingerprint())
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class PreprocessingCache:
+    def __init__(self, path, maxsize=2 ** 30):
+        """
+        - path: str, sqlite database file
+        - maxsize: int, upper bound in bytes on cached output, least recently used documents are evicted first
+
+        Documents are keyed by a hash of the raw text and the fingerprint of the preprocessor chain,
+        so the same cache can be shared between pipelines and only new or changed documents are preprocessed.
+        Values are str or, e.g. tokens of a pipeline with a tokenizer, anything JSON can encode.
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (key TEXT PRIMARY KEY, value TEXT, size INTEGER, atime REAL, encoded INTEGER DEFAULT 0)"
+            )
+        # caches from before non-str values hold str only
+        if "encoded" not in [row[1] for row in self.db.execute("PRAGMA table_info(docs)")]:
+            self.db.execute("ALTER TABLE docs ADD COLUMN encoded INTEGER DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS docs_atime ON docs (atime)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+        # running total of the cached bytes, kept up to date by triggers (REPLACE fires the delete
+        # trigger only with recursive triggers), caches from before the total are summed once
+        self.db.execute("PRAGMA recursive_triggers = ON")
+        if self.db.execute("SELECT 1 FROM stats WHERE name = 'size'").fetchone() is None:
+            self.db.execute("INSERT INTO stats SELECT 'size', COALESCE(SUM(size), 0) FROM docs")
+        self.db.execute(
+            "CREATE TRIGGER IF NOT EXISTS docs_insert AFTER INSERT ON docs "
+            "BEGIN UPDATE stats SET value = value + NEW.size WHERE name = 'size'; END"
+            )
+        self.db.execute(
+            "CREATE TRIGGER IF NOT EXISTS docs_delete AFTER DELETE ON docs "
+            "BEGIN UPDATE stats SET value = value - OLD.size WHERE name = 'size'; END"
+            )
+        self.db.commit()
+
+    @staticmethod
+    def key(fingerprint, text):
+        return hashlib.sha1("{}\0{}".format(fingerprint, text).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """ return dict of cached values for the keys that are present
+        """
+        found = dict()
+        unique = list(set(keys))
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            rows = self.db.execute(
+                "SELECT key, value, encoded FROM docs WHERE key IN ({})".format(",".join("?" * len(batch))), batch
+                )
+            found.update((k, json.loads(v) if encoded else v) for k, v, encoded in rows)
+        if found:
+            now = time.time()
+            self.db.executemany("UPDATE docs SET atime = ? WHERE key = ?", [(now, k) for k in found])
+        hits = sum(1 for k in keys if k in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        """ store (key, value) pairs and evict if the cache outgrows maxsize, values other than str are stored as JSON
+        """
+        now = time.time()
+        rows = list()
+        for k, v in items:
+            encoded = not isinstance(v, str)
+            if encoded:
+                try:
+                    v = json.dumps(v, ensure_ascii=False)
+                except TypeError:
+                    raise ValueError("cannot cache preprocessed output of type {}".format(type(v).__name__))
+            rows.append((k, v, len(v.encode("utf-8")), now, int(encoded)))
+        self.db.executemany("INSERT OR REPLACE INTO docs (key, value, size, atime, encoded) VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+        self.evict()
+
+    def size(self):
+        return self.db.execute("SELECT value FROM stats WHERE name = 'size'").fetchone()[0]
+
+    def evict(self):
+        """ drop least recently used documents until the cache is at most 90% of maxsize
+        """
+        size = self.size()
+        if size <= self.maxsize:
+            return
+        target = 0.9 * self.maxsize
+        rows = self.db.execute("SELECT key, size FROM docs ORDER BY atime")
+        drop = list()
+        for k, s in rows:
+            if size <= target:
+                break
+            drop.append((k,))
+            size -= s
+        self.db.executemany("DELETE FROM docs WHERE key = ?", drop)
+        self.db.commit()
+
+    def stats(self):
+        """ hit/miss counts of this run and accumulated over all runs on this cache file
+        """
+        total = dict(self.db.execute("SELECT name, value FROM stats"))
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": total["hits"] + self.hits,
+            "total_misses": total["misses"] + self.misses,
+            "size": self.size(),
+            }
+
+    def close(self):
+        self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'hits'", (self.hits,))
+        self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'misses'", (self.misses,))
+        self.db.commit()
+        self.db.close()
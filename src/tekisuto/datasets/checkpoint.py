@@ -0,0 +1,106 @@
+"""
+Append-only checkpoints for resumable dataset loading
+"""
+import os
+import json
+import pickle
+import shutil
+import hashlib
+
+MANIFEST = "manifest.json"
+# bytes of the input hashed to identify it
+HEAD = 2 ** 16
+
+
+def _atomic_write(path, payload, mode="w"):
+    """ write to a temporary file, flush it to disk and move it in place
+    """
+    tmp = path + ".tmp"
+    with open(tmp, mode) as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def source_identity(path):
+    """ size, modification time and a hash of the first bytes of a file, changes when the file is edited or replaced
+    """
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        head = hashlib.sha1(f.read(HEAD)).hexdigest()
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "head": head}
+
+
+class Checkpoint:
+    def __init__(self, directory):
+        """
+        - directory: str, directory holding one pickled segment per committed batch and a manifest
+
+        The manifest records the input byte offset after the last committed record and is
+        only rewritten after its segment is safely on disk, so a killed run loses at most
+        the batch in progress.
+        """
+        self.directory = directory
+        self.manifest = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def resume(self, source, fields, chain=None):
+        """ open the checkpoint for source and return the byte offset to continue from
+            - chain: str, fingerprint of the preprocessor chain (see cache.chain_fingerprint),
+              None if the chain cannot be fingerprinted, which never resumes
+            - a checkpoint written for another file, an edited or replaced file, other fields
+              or another preprocessor chain is discarded
+        """
+        self.manifest = None
+        identity = source_identity(source)
+        if os.path.isfile(self._path(MANIFEST)):
+            with open(self._path(MANIFEST), "r") as f:
+                manifest = json.load(f)
+            if chain is not None and manifest["source"] == os.path.abspath(source) and manifest["fields"] == list(fields) \
+                    and manifest.get("identity") == identity and manifest.get("chain") == chain \
+                    and manifest["offset"] <= identity["size"]:
+                self.manifest = manifest
+            else:
+                print("[INFO] discarding checkpoint in {} written for other input or preprocessing".format(self.directory))
+                self.clear()
+
+        if self.manifest is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.manifest = {
+                "source": os.path.abspath(source), "identity": identity, "chain": chain,
+                "fields": list(fields), "offset": 0, "count": 0, "segments": list(),
+                }
+
+        return self.manifest["offset"]
+
+    @property
+    def count(self):
+        return self.manifest["count"] if self.manifest else 0
+
+    def commit(self, records, offset):
+        """ append one batch of records as a new segment
+            - offset: input byte offset just after the last record of the batch
+        """
+        name = "segment-{:06d}.pcl".format(len(self.manifest["segments"]))
+        _atomic_write(self._path(name), pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL), mode="wb")
+        self.manifest["segments"].append(name)
+        self.manifest["offset"] = offset
+        self.manifest["count"] += len(records)
+        _atomic_write(self._path(MANIFEST), json.dumps(self.manifest))
+
+    def __iter__(self):
+        """ generator of all committed records in input order
+        """
+        for name in self.manifest["segments"]:
+            with open(self._path(name), "rb") as f:
+                records = pickle.load(f)
+            for record in records:
+                yield record
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        self.manifest = None
@@ -3,6 +3,8 @@
 import os
 import numpy as np
 
+from .preprocessingpool import PreprocessingPool
+
 class DatasetLoader:
     def __init__(self, preprocessors=None):
         self.preprocessors=preprocessors
@@ -10,22 +12,26 @@ class DatasetLoader:
         if self.preprocessors is None:
             self.preprocessors = list()
     
-    def load(self, textPaths, verbose=-1):
+    def load(self, textPaths, verbose=-1, workers=1, chunksize=64, cache=None):
+        """
+            - workers: integer number of preprocessing processes, output keeps the order of textPaths
+            - chunksize: integer number of texts sent to a preprocessing process at a time
+            - cache: PreprocessingCache, texts found in the cache are not preprocessed again
+        """
         data = list()
         labels = list()
         filenames = list()
 
-        for (i, textPath) in enumerate(textPaths):
-            with open(textPath, "r") as f:
-                text = f.read()
+        def read():
+            for textPath in textPaths:
+                with open(textPath, "r") as f:
+                    yield f.read()
+
+        pool = PreprocessingPool(self.preprocessors, workers=workers, chunksize=chunksize, cache=cache)
+        for (i, (textPath, text)) in enumerate(zip(textPaths, pool.imap(read()))):
             label = textPath.split(os.path.sep)[-2]
             filename = textPath.split(os.path.sep)[-1]
 
-
-            if self.preprocessors is not None:
-                for p in self.preprocessors:
-                    text = p.preprocess(text)
-            
             data.append(text)
             labels.append(label)
             filenames.append(filename)
@@ -5,6 +5,8 @@ import os
 import numpy as np
 import pandas as pd
 
+from .preprocessingpool import PreprocessingPool
+
 class DatasetLoaderTable:
     def __init__(self, preprocessors=None):
         self.preprocessors=preprocessors
@@ -12,7 +14,12 @@ class DatasetLoaderTable:
         if self.preprocessors is None:
             self.preprocessors = list()
     
-    def load(self, tablePath, datacol, timecol=None, clscol=None, verbose=-1):
+    def load(self, tablePath, datacol, timecol=None, clscol=None, verbose=-1, workers=1, chunksize=64, cache=None):
+        """
+            - workers: integer number of preprocessing processes, output keeps the row order
+            - chunksize: integer number of texts sent to a preprocessing process at a time
+            - cache: PreprocessingCache, texts found in the cache are not preprocessed again
+        """
         df = pd.read_csv(tablePath)
         data = df[datacol].values
         if timecol:
@@ -25,14 +32,8 @@ class DatasetLoaderTable:
             cls = []
         
         
-        for (i, text) in enumerate(data):
-            if isinstance(text, str):
-                if self.preprocessors is not None:
-                    for p in self.preprocessors:
-                        text = p.preprocess(text)
-            else:
-                text = text
-            
+        pool = PreprocessingPool(self.preprocessors, workers=workers, chunksize=chunksize, cache=cache)
+        for (i, text) in enumerate(pool.imap(list(data))):
             data[i] = text
 
             if verbose > 0 and i > 0 and (i + 1) % verbose == 0:
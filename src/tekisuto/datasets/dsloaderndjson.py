@@ -1,9 +1,14 @@
 """
-Dataset loader for ndjson newpaper file 
+Dataset loader for ndjson newpaper file
 """
 import os
 import json
-import pickle
+
+from .cache import chain_fingerprint
+from .checkpoint import Checkpoint
+from .extsort import argsort, external_sort
+from .preprocessingpool import PreprocessingPool
+
 
 class DatasetLoaderNdjson:
     def __init__(self, preprocessors=None):
@@ -11,49 +16,122 @@ class DatasetLoaderNdjson:
 
         if self.preprocessors is None:
             self.preprocessors = list()
-    
-    def load(self, filepath, datesort=False, verbose=-1, bytestore=-1):
+
+    def iterlines(self, filepath, offset=0):
+        """ generator of (end byte offset, raw line) pairs, skipping blank lines
+            - offset: byte offset to start reading from
+        """
+        with open(filepath, "rb") as fobj:
+            fobj.seek(offset)
+            for ligne in fobj:
+                offset += len(ligne)
+                if ligne.strip():
+                    yield offset, ligne
+
+    def iterrecords(self, filepath, fields=("text", "title", "date"), offset=0, workers=1, chunksize=64, cache=None):
+        """ generator of (end byte offset, record) pairs, see iterload
+        """
+        def parsed():
+            for end, ligne in self.iterlines(filepath, offset=offset):
+                dobj = json.loads(ligne)
+                yield end, {field: dobj[field] for field in fields}
+
+        if "text" not in fields:
+            for pair in parsed():
+                yield pair
+            return
+
+        pool = PreprocessingPool(self.preprocessors, workers=workers, chunksize=chunksize, cache=cache)
+        for chunk, texts in pool.imap_chunks(parsed(), lambda chunk: [record["text"] for _, record in chunk]):
+            for (end, record), text in zip(chunk, texts):
+                record["text"] = text
+                yield end, record
+
+    def iterload(self, filepath, fields=("text", "title", "date"), offset=0, workers=1, chunksize=64, cache=None):
+        """ generator of preprocessed records, one dict per line
+            - fields: fields to keep from each json object, everything else is dropped on parsing
+            - offset: byte offset to start reading from
+            - workers: number of preprocessing processes, records are still yielded in file order
+            - chunksize: number of records sent to a preprocessing process at a time
+            - cache: PreprocessingCache, texts found in the cache are not preprocessed again
+        """
+        for _, record in self.iterrecords(filepath, fields=fields, offset=offset, workers=workers, chunksize=chunksize, cache=cache):
+            yield record
+
+    def load(self, filepath, datesort=False, verbose=-1, bytestore=-1, fields=("text", "title", "date"), sortbuffer=None, workers=1, chunksize=64, checkpoint="dataloader_checkpoint", cache=None):
         """
-            - bytestore: integer step for temporary byte stream storage of output
+            - fields: fields to keep, fields that are left out are returned as empty lists
+            - datesort: sort output by date (stable, ties keep input order)
+            - sortbuffer: integer number of records to sort in memory
+                - None sorts in memory with one permutation for all fields
+                - otherwise records are sorted in on-disk runs of sortbuffer records and merged
+            - bytestore: integer step for checkpointing preprocessed records
                 - option is relevant when using slow prerocessing on larger data sets (e.g., lemmatization)
-                - bs backups are not sorted
+                - every bytestore records are appended as a new segment to the checkpoint directory
+                - an interrupted load resumes from the last committed input offset
+            - checkpoint: str, checkpoint directory used with bytestore, remove it to start over
+            - workers: integer number of preprocessing processes (see iterload)
+            - chunksize: integer number of records sent to a preprocessing process at a time
+            - cache: PreprocessingCache of preprocessed texts (see iterload)
         """
-        data = list()
-        titles = list()
-        dates = list()
+        fields = tuple(fields)
+        if datesort and "date" not in fields:
+            fields = fields + ("date",)
+        size = os.path.getsize(filepath)
 
-        with open(filepath, "r") as fobj:
-            lignes = fobj.readlines()
+        offset = 0
+        count = 0
+        if bytestore > 0:
+            ckpt = Checkpoint(checkpoint)
+            try:
+                chain = chain_fingerprint(self.preprocessors)
+            except ValueError:
+                print("[INFO] preprocessors without fingerprint, checkpoints are not resumed")
+                chain = None
+            offset = ckpt.resume(filepath, fields, chain=chain)
+            count = ckpt.count
+            if offset > 0:
+                print("[INFO] resuming from checkpoint at byte {}/{} ({} documents)".format(offset, size, count))
 
-            for (i, ligne) in enumerate(lignes):
-                dobj = json.loads(ligne)
-                text = dobj["text"]
-                title = dobj["title"]
-                date = dobj["date"]
-
-                if self.preprocessors is not None:
-                    for p in self.preprocessors:
-                        text = p.preprocess(text)
-            
-                data.append(text)
-                titles.append(title)
-                dates.append(date)
+        def records():
+            for (i, (end, record)) in enumerate(self.iterrecords(filepath, fields=fields, offset=offset, workers=workers, chunksize=chunksize, cache=cache), count):
+                yield end, record
 
                 if verbose > 0 and i > 0 and (i + 1) % verbose == 0:
-                    print("[INFO] processed {}/{}".format(i + 1, len(lignes)))
-                
-                if bytestore > 0 and i > 0 and (i + 1) % bytestore == 0:
+                    print("[INFO] processed {} ({:.1f}% of input)".format(i + 1, 100. * end / size))
+
+        if bytestore > 0:
+            batch = list()
+            for end, record in records():
+                batch.append(record)
+                if len(batch) == bytestore:
                     print("[INFO] storing intermediary results ...")
-                    bsobj = dict()
-                    bsobj["data"] = data
-                    bsobj["titles"] = titles
-                    bsobj["dates"] = dates
-                    with open("dataloader_bytestorage.pcl", "wb") as f:
-                        pickle.dump(bsobj, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-        if datesort:
-            data = [text for _,text in sorted(zip(dates, data))]
-            titles = [title for _,title in sorted(zip(dates, titles))]
-            dates = sorted(dates)
-        
+                    ckpt.commit(batch, end)
+                    batch = list()
+            if batch:
+                ckpt.commit(batch, end)
+            stream = iter(ckpt)
+        else:
+            stream = (record for _, record in records())
+
+        if datesort and sortbuffer:
+            stream = external_sort(stream, key=lambda record: record["date"], buffersize=sortbuffer)
+
+        data = list()
+        titles = list()
+        dates = list()
+        for record in stream:
+            if "text" in fields:
+                data.append(record["text"])
+            if "title" in fields:
+                titles.append(record["title"])
+            if "date" in fields:
+                dates.append(record["date"])
+
+        if datesort and not sortbuffer:
+            idx = argsort(dates)
+            data = [data[j] for j in idx] if data else data
+            titles = [titles[j] for j in idx] if titles else titles
+            dates = [dates[j] for j in idx]
+
         return (data, titles, dates)
@@ -0,0 +1,70 @@
+"""
+Bounded-memory sorting of record streams
+"""
+import os
+import heapq
+import pickle
+import tempfile
+from itertools import islice
+
+
+def _write_run(run, tmpdir):
+    """ dump one sorted run to a temporary file and return its path
+    """
+    fd, path = tempfile.mkstemp(prefix="extsort_", suffix=".run", dir=tmpdir)
+    with os.fdopen(fd, "wb") as f:
+        for item in run:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+
+
+def argsort(keys):
+    """ stable permutation that sorts keys in ascending order
+    """
+    return sorted(range(len(keys)), key=keys.__getitem__)
+
+
+def external_sort(records, key, buffersize=100000, tmpdir=None):
+    """ generator sorting an arbitrarily long iterable of records with bounded memory
+        - records: iterable of picklable objects
+        - key: callable, sort key of a record
+        - buffersize: int, number of records held in memory at once
+        - tmpdir: str, directory for temporary sorted runs (default system temp)
+
+    Records are sorted in runs of buffersize, spilled to disk and merged lazily.
+    The sort is stable, i.e. records with equal keys keep their input order.
+    If the input fits in one buffer, nothing is written to disk.
+    """
+    records = iter(records)
+    seq = 0
+    runs = list()
+    try:
+        while True:
+            run = [(key(record), seq + i, record) for i, record in enumerate(islice(records, buffersize))]
+            if not run:
+                break
+            seq += len(run)
+            run.sort(key=lambda item: (item[0], item[1]))
+            if not runs and len(run) < buffersize:
+                for item in run:
+                    yield item[2]
+                return
+            runs.append(_write_run(run, tmpdir))
+            del run
+
+        merged = heapq.merge(*[_read_run(path) for path in runs], key=lambda item: (item[0], item[1]))
+        for item in merged:
+            yield item[2]
+    finally:
+        for path in runs:
+            if os.path.isfile(path):
+                os.remove(path)
@@ -0,0 +1,153 @@
+"""
+Order-preserving (multi-process) application of a preprocessor chain
+"""
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+from .cache import chain_fingerprint
+
+_preprocessors = None
+
+
+def memos(preprocessors):
+    """ LemmaMemo tables of a preprocessor chain (also inside a CompiledPipeline), in chain order
+    """
+    found = list()
+    for p in preprocessors:
+        if getattr(p, "memo", None) is not None:
+            found.append(p.memo)
+        if hasattr(p, "preprocessors"):
+            found.extend(memos(p.preprocessors))
+    return found
+
+
+def _init_worker(preprocessors):
+    """ runs once per worker process, preprocessors are unpickled (i.e. built) only here
+    """
+    global _preprocessors
+    _preprocessors = preprocessors
+    for memo in memos(preprocessors):
+        memo.tracking = True
+
+
+def _work(texts):
+    """ preprocessed texts and what the memo tables of the worker learned on them
+    """
+    return apply_preprocessors(texts, _preprocessors), [memo.drain() for memo in memos(_preprocessors)]
+
+
+def apply_preprocessors(texts, preprocessors):
+    """ run a list of texts through the preprocessor chain, non-str items (e.g. NaN) are passed through
+        - preprocessors with a preprocess_batch(texts) method get the whole list at once
+    """
+    idx = [i for i, text in enumerate(texts) if isinstance(text, str)]
+    batch = [texts[i] for i in idx]
+    for p in preprocessors:
+        if hasattr(p, "preprocess_batch"):
+            batch = p.preprocess_batch(batch)
+        else:
+            batch = [p.preprocess(text) for text in batch]
+    out = list(texts)
+    for i, text in zip(idx, batch):
+        out[i] = text
+    return out
+
+
+class PreprocessingPool:
+    def __init__(self, preprocessors, workers=1, chunksize=64, cache=None):
+        """
+        - preprocessors: list of objects with a preprocess(text) method
+        - workers: int, number of processes, 1 runs in the main process
+        - chunksize: int, number of documents sent to a worker at a time, also the batch given to preprocess_batch
+        - cache: PreprocessingCache, only documents missing from the cache are preprocessed
+        """
+        self.preprocessors = preprocessors if preprocessors is not None else list()
+        self.workers = workers
+        self.chunksize = chunksize
+        self.cache = cache
+        if cache is not None:
+            self.fingerprint = chain_fingerprint(self.preprocessors)
+
+    def _chunks(self, items):
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, self.chunksize))
+            if not chunk:
+                break
+            yield chunk
+
+    def _lookup(self, raw):
+        """ split a chunk of raw texts into cached results and texts left to preprocess
+        """
+        if self.cache is None:
+            return None, dict(), raw
+        keys = [self.cache.key(self.fingerprint, text) if isinstance(text, str) else None for text in raw]
+        found = self.cache.get_many([k for k in keys if k is not None])
+        todo = [text for text, k in zip(raw, keys) if k not in found]
+        return keys, found, todo
+
+    def _merge(self, raw, keys, found, processed):
+        if self.cache is None:
+            return processed
+        processed = iter(processed)
+        out = list()
+        new = list()
+        for text, k in zip(raw, keys):
+            if k in found:
+                out.append(found[k])
+            else:
+                text = next(processed)
+                if k is not None:
+                    new.append((k, text))
+                out.append(text)
+        if new:
+            self.cache.put_many(new)
+        return out
+
+    def imap_chunks(self, items, texts):
+        """ generator of (chunk of items, preprocessed texts of chunk) pairs in input order
+            - items: iterable of arbitrary objects, e.g. records
+            - texts: callable returning the list of texts of a chunk of items
+        """
+        chunks = self._chunks(items)
+        if self.workers is None or self.workers <= 1:
+            for chunk in chunks:
+                raw = texts(chunk)
+                keys, found, todo = self._lookup(raw)
+                yield chunk, self._merge(raw, keys, found, apply_preprocessors(todo, self.preprocessors))
+            return
+
+        pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.preprocessors,))
+        tables = memos(self.preprocessors)
+
+        def collect(result):
+            # memo tables learned in the workers are merged into the tables of the main process
+            processed, deltas = result.get()
+            for memo, delta in zip(tables, deltas):
+                memo.merge(delta)
+            return processed
+
+        try:
+            # bounded number of chunks in flight, so streaming input stays streaming
+            pending = deque()
+            for chunk in chunks:
+                raw = texts(chunk)
+                keys, found, todo = self._lookup(raw)
+                pending.append((chunk, raw, keys, found, pool.apply_async(_work, (todo,))))
+                if len(pending) >= 2 * self.workers:
+                    chunk, raw, keys, found, result = pending.popleft()
+                    yield chunk, self._merge(raw, keys, found, collect(result))
+            while pending:
+                chunk, raw, keys, found, result = pending.popleft()
+                yield chunk, self._merge(raw, keys, found, collect(result))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def imap(self, texts):
+        """ generator of preprocessed texts in input order
+        """
+        for _, processed in self.imap_chunks(texts, lambda chunk: chunk):
+            for text in processed:
+                yield text
@@ -0,0 +1,130 @@
+"""
+Compact integer-interned token corpus
+"""
+import hashlib
+from array import array
+
+import numpy as np
+from gensim import corpora
+
+
+class TokenDocument:
+    """ lightweight view of one document in a TokenCorpus
+    """
+    __slots__ = ("corpus", "start", "end")
+
+    def __init__(self, corpus, start, end):
+        self.corpus = corpus
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def ids(self):
+        return self.corpus.ids[self.start:self.end]
+
+    def __iter__(self):
+        vocab = self.corpus.vocab
+        for i in self.ids:
+            yield vocab[i]
+
+    def __getitem__(self, i):
+        return self.tolist()[i]
+
+    def tolist(self):
+        vocab = self.corpus.vocab
+        return [vocab[i] for i in self.ids.tolist()]
+
+
+class TokenCorpus:
+    def __init__(self, vocab, ids, offsets):
+        """
+        - vocab: list of str, token of each id
+        - ids: int32 array, token ids of all documents concatenated
+        - offsets: int64 array of length n_docs + 1, document i is ids[offsets[i]:offsets[i + 1]]
+
+        Iterating yields one list of str per document, so the corpus can stand in for
+        a list of token lists, e.g. as texts of gensim's CoherenceModel.
+        """
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_texts(cls, texts):
+        """ build from an iterable of token lists in one pass
+        """
+        token2id = dict()
+        ids = array("i")
+        offsets = array("q", [0])
+        for tokens in texts:
+            for token in tokens:
+                i = token2id.get(token)
+                if i is None:
+                    i = token2id[token] = len(token2id)
+                ids.append(i)
+            offsets.append(len(ids))
+        vocab = sorted(token2id, key=token2id.get)
+        return cls(vocab, np.frombuffer(ids, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        return TokenDocument(self, self.offsets[i], self.offsets[i + 1])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i].tolist()
+
+    def frequencies(self, chunksize=100000):
+        """ (collection frequency, document frequency) arrays indexed by token id
+            - chunksize: number of documents counted at a time
+        """
+        V = len(self.vocab)
+        cfs = np.bincount(self.ids, minlength=V)
+        dfs = np.zeros(V, dtype=np.int64)
+        for start in range(0, len(self), chunksize):
+            stop = min(start + chunksize, len(self))
+            lo, hi = self.offsets[start], self.offsets[stop]
+            docs = np.repeat(np.arange(stop - start, dtype=np.int64), np.diff(self.offsets[start:stop + 1]))
+            pairs = np.unique(docs * V + self.ids[lo:hi])
+            dfs += np.bincount(pairs % V, minlength=V)
+        return cfs, dfs
+
+    def to_dictionary(self):
+        """ gensim Dictionary with the corpus statistics, without re-reading the documents
+        """
+        cfs, dfs = self.frequencies()
+        dictionary = corpora.Dictionary()
+        dictionary.token2id = {token: i for i, token in enumerate(self.vocab)}
+        dictionary.cfs = dict(enumerate(cfs.tolist()))
+        dictionary.dfs = dict(enumerate(dfs.tolist()))
+        dictionary.num_docs = len(self)
+        dictionary.num_pos = int(cfs.sum())
+        dictionary.num_nnz = int(dfs.sum())
+        return dictionary
+
+    def bows(self, dictionary):
+        """ generator of bag-of-words documents in the id space of dictionary (e.g. after filter_extremes)
+        """
+        remap = np.array([dictionary.token2id.get(token, -1) for token in self.vocab], dtype=np.int64)
+        for i in range(len(self)):
+            ids = remap[self.ids[self.offsets[i]:self.offsets[i + 1]]]
+            ids, counts = np.unique(ids[ids >= 0], return_counts=True)
+            yield list(zip(ids.tolist(), counts.tolist()))
+
+    def fingerprint(self):
+        """ content hash of the corpus
+        """
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.ids).tobytes())
+        h.update(np.ascontiguousarray(self.offsets).tobytes())
+        h.update("\0".join(self.vocab).encode("utf-8"))
+        return h.hexdigest()
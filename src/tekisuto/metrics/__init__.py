@@ -1,2 +1,3 @@
 from .entropies import kld
-from .entropies import jsd
\ No newline at end of file
+from .entropies import jsd
+from .banded import lag_bands
\ No newline at end of file
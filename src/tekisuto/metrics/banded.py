@@ -0,0 +1,125 @@
+"""
+Divergences between every document and its neighbours at lags 1..window, computed as whole-array operations
+"""
+import numpy as np
+from scipy import special
+
+from .entropies import kld, jsd
+
+
+def _kld_prepare(block):
+    with np.errstate(divide="ignore"):
+        return block, np.log10(block)
+
+
+def _kld_pairs(a, b):
+    """ kld of aligned rows, logs of both sides precomputed
+    """
+    (p, logp), (q, logq) = a, b
+    with np.errstate(invalid="ignore"):
+        return np.where(p != 0, (p - q) * (logp - logq), 0).sum(axis=1)
+
+
+def _jsd_prepare(block):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        block = block / block.sum(axis=1, keepdims=True)
+    return block, special.entr(block).sum(axis=1)
+
+
+def _jsd_pairs(a, b):
+    """ jsd of aligned rows as H((p + q) / 2) - (H(p) + H(q)) / 2, row entropies precomputed
+    """
+    (p, hp), (q, hq) = a, b
+    return np.maximum(special.entr((p + q) / 2).sum(axis=1) - (hp + hq) / 2, 0)
+
+
+def _generic_kernel(meas):
+    def pairs(a, b):
+        return np.array([meas(p, q) for p, q in zip(a[0], b[0])], dtype=np.float64)
+    return (lambda block: (block,)), pairs
+
+
+# vectorized kernels of the measures in tekisuto.metrics and whether the measure is symmetric,
+# other measures are called pair by pair
+KERNELS = {
+    kld: (_kld_prepare, _kld_pairs, False),
+    jsd: (_jsd_prepare, _jsd_pairs, True),
+    }
+
+
+def kernel(meas):
+    """ (prepare, pairs, symmetric) of meas, prepare(block) returns a tuple of per-row arrays
+        (e.g. rows and their logs) and pairs(a, b) the divergences of aligned prepared rows
+    """
+    if meas in KERNELS:
+        return KERNELS[meas]
+    prepare, pairs = _generic_kernel(meas)
+    return prepare, pairs, False
+
+
+def lag_bands(data, window, meas=kld, chunksize=10000):
+    """ bands of divergences meas(x_i, x_{i-l}) and meas(x_i, x_{i+l}) for l = 1..window,
+        every pair of documents is visited once
+        - data: array (m, k), documents in time order, may be memory-mapped
+        - window: int, largest lag
+        - meas: kld, jsd or any function meas(p, q) of two distributions
+        - chunksize: int, number of rows per block, memory grows with chunksize + window rows
+
+        returns two float64 arrays (m, window), past and future, column l - 1 holds the divergence
+        at lag l, NaN where the neighbour lies outside data. For symmetric measures (jsd) the
+        future band is the past band shifted by the lag, otherwise the reverse divergence is
+        computed from the same prepared rows.
+    """
+    data = np.asarray(data)
+    m = data.shape[0]
+    prepare, pairs, symmetric = kernel(meas)
+    past = np.full((m, window), np.nan)
+    future = np.full((m, window), np.nan)
+    for start in range(0, m, chunksize):
+        stop = min(m, start + chunksize)
+        lo = max(0, start - window)
+        # logs and entropies of every row of the block, shared by all lags
+        rows = prepare(np.asarray(data[lo:stop], dtype=np.float64))
+        for lag in range(1, window + 1):
+            first = max(start, lag)
+            if first >= stop:
+                continue
+            x = tuple(r[first - lo:stop - lo] for r in rows)
+            xx = tuple(r[first - lo - lag:stop - lo - lag] for r in rows)
+            past[first:stop, lag - 1] = pairs(x, xx)
+            if not symmetric:
+                future[first - lag:stop - lag, lag - 1] = pairs(xx, x)
+    if symmetric:
+        for lag in range(1, window + 1):
+            future[:m - lag, lag - 1] = past[lag:, lag - 1]
+    return past, future
+
+
+def band_stats(band, count, valid=None):
+    """ mean and (population) standard deviation of the first count[i] columns of every row of band,
+        rows with count 0 get 0
+        - band: array (m, window), see lag_bands
+        - count: array (m,) or (n_windows, m), several windows are read from the same cumulative sums over lags
+        - valid: bool array like band, only these entries are averaged (e.g. neighbours that are not empty bins)
+
+        returns two arrays with the shape of count
+    """
+    count = np.asarray(count)
+    rows = np.arange(band.shape[0])
+    column = np.maximum(count, 1) - 1
+    if valid is None:
+        n = np.maximum(count, 1)
+        values, first = band, band[:, 0]
+    else:
+        n = np.cumsum(valid, axis=1)[rows, column]
+        count = np.where(count > 0, n, 0)
+        n = np.maximum(n, 1)
+        values, first = np.where(valid, band, 0), band[rows, np.argmax(valid, axis=1)]
+    with np.errstate(invalid="ignore"):
+        mean = np.cumsum(values, axis=1)[rows, column] / n
+        # variance from sums shifted by the first value, which keeps it exact for similar values
+        shifted = values - first[:, None]
+        if valid is not None:
+            shifted = np.where(valid, shifted, 0)
+        var = np.cumsum(shifted ** 2, axis=1)[rows, column] / n - (np.cumsum(shifted, axis=1)[rows, column] / n) ** 2
+    return np.where(count > 0, mean, 0), np.where(count > 0, np.sqrt(np.maximum(var, 0)), 0)
@@ -5,8 +5,8 @@ from scipy import stats
 def kld(p, q):
     """ KL-divergence for two probability distributions
     """
-    p = np.asarray(p, dtype=np.float)
-    q = np.asarray(q, dtype=np.float)
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
 
     return np.sum(np.where(p != 0, (p-q) * np.log10(p / q), 0))
 
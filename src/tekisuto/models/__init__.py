@@ -1,3 +1,6 @@
 from .latentsemantics import LatentSemantics
 from .infodynamics import InfoDynamics
-from .topicmodeling import TopicModel
\ No newline at end of file
+from .infodynamics import StreamingInfoDynamics
+from .topicmodeling import TopicModel
+from .coherence import SharedCoherence
+from .artifact import ModelArtifact
\ No newline at end of file
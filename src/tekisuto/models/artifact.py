@@ -0,0 +1,151 @@
+"""
+Versioned model artifact directory with memory-mappable parts
+"""
+import os
+import json
+import pickle
+import importlib
+
+import numpy as np
+from gensim import corpora, utils
+
+from tekisuto.tekiutil import dates_to_epoch
+
+FORMAT = "tekisuto-model"
+# 2: utc offsets of the dates
+VERSION = 2
+
+# file names inside the artifact directory
+THETA = "theta.npy"
+DATES = "dates.npy"
+OFFSETS = "offsets.npy"
+CORPUS = "corpus.mm"
+ID2WORD = "id2word.dict"
+MODEL = os.path.join("model", "model")
+MANIFEST = "manifest.json"
+
+
+def _atomic_save(path, array):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+class ModelArtifact:
+    def __init__(self, path):
+        """ read access to an artifact written by ModelArtifact.write
+            - path: str, artifact directory
+
+        Every part is read on demand: theta and dates are memory-mapped .npy files, the corpus
+        is an indexed Matrix Market file, dictionary and model use gensim's native save format.
+        """
+        self.path = path
+        with open(os.path.join(path, MANIFEST), "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError("{} is not a {} artifact".format(path, FORMAT))
+        if self.manifest["version"] > VERSION:
+            raise ValueError("artifact version {} is newer than supported version {}".format(self.manifest["version"], VERSION))
+
+    @classmethod
+    def write(cls, path, theta, dates, model=None, id2word=None, corpus=None, offsets=None, **metadata):
+        """ write (or overwrite) an artifact
+            - theta: array (n_docs, k), stored as float32
+            - dates: list of ISO 8601 str or int64 epoch seconds, stored as int64 epoch seconds
+            - offsets: int32 utc offsets of the dates (see tekiutil.dates_to_epoch), taken from the
+              strings if dates are ISO 8601, so signals can be written with the offsets of the source
+            - model: fitted model with save() (gensim models, GibbsLda)
+            - id2word: gensim Dictionary or HashDictionary
+            - corpus: iterable of bag-of-words documents, an MmCorpus already in path is kept as is
+            - **metadata: json serializable values added to the manifest (e.g. language, source)
+        """
+        os.makedirs(path, exist_ok=True)
+        theta = np.asarray(theta, dtype=np.float32)
+        dates = np.asarray(dates)
+        if dates.dtype.kind in "US":
+            dates, offsets = dates_to_epoch(dates.tolist(), offsets=True)
+        dates = dates.astype(np.int64)
+        if len(dates) != theta.shape[0]:
+            raise ValueError("{} dates for {} documents".format(len(dates), theta.shape[0]))
+        _atomic_save(os.path.join(path, THETA), theta)
+        _atomic_save(os.path.join(path, DATES), dates)
+
+        parts = [THETA, DATES]
+        if offsets is not None:
+            _atomic_save(os.path.join(path, OFFSETS), np.asarray(offsets, dtype=np.int32))
+            parts.append(OFFSETS)
+        if corpus is not None:
+            target = os.path.join(path, CORPUS)
+            if not (isinstance(corpus, corpora.MmCorpus) and os.path.abspath(corpus.input) == os.path.abspath(target)):
+                corpora.MmCorpus.serialize(target, corpus, id2word=id2word)
+            parts.append(CORPUS)
+        if id2word is not None:
+            id2word.save(os.path.join(path, ID2WORD))
+            parts.append(ID2WORD)
+        model_class = None
+        if model is not None:
+            os.makedirs(os.path.dirname(os.path.join(path, MODEL)), exist_ok=True)
+            model.save(os.path.join(path, MODEL))
+            model_class = "{}.{}".format(type(model).__module__, type(model).__name__)
+            parts.append(MODEL)
+
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "n_docs": int(theta.shape[0]),
+            "k": int(theta.shape[1]),
+            "model_class": model_class,
+            "parts": parts,
+            }
+        manifest.update(metadata)
+        tmp = os.path.join(path, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, os.path.join(path, MANIFEST))
+        return cls(path)
+
+    def _part(self, name):
+        if name not in self.manifest["parts"]:
+            raise ValueError("artifact {} has no {}".format(self.path, name))
+        return os.path.join(self.path, name)
+
+    def theta(self, mmap_mode="r"):
+        """ float32 array (n_docs, k), memory-mapped unless mmap_mode is None
+        """
+        return np.load(self._part(THETA), mmap_mode=mmap_mode)
+
+    def dates(self, mmap_mode="r"):
+        """ int64 array of seconds since the epoch (UTC), see tekiutil.epoch_to_dates
+        """
+        return np.load(self._part(DATES), mmap_mode=mmap_mode)
+
+    def offsets(self):
+        """ int32 array of the utc offsets of the dates in seconds, None for artifacts without them (UTC)
+        """
+        if OFFSETS not in self.manifest["parts"]:
+            return None
+        return np.load(self._part(OFFSETS))
+
+    def corpus(self):
+        return corpora.MmCorpus(self._part(CORPUS))
+
+    def id2word(self):
+        return utils.SaveLoad.load(self._part(ID2WORD))
+
+    def model(self):
+        path = self._part(MODEL)
+        module, name = self.manifest["model_class"].rsplit(".", 1)
+        return getattr(importlib.import_module(module), name).load(path)
+
+
+def load_signal_input(path):
+    """ theta, int64 epoch dates and their utc offsets (None if unknown) from an artifact directory
+        or a legacy *_model.pcl pickle
+    """
+    if os.path.isdir(path):
+        artifact = ModelArtifact(path)
+        return artifact.theta(), artifact.dates(), artifact.offsets()
+    with open(path, "rb") as fobj:
+        mdl = pickle.load(fobj)
+    epoch, offsets = dates_to_epoch(mdl["dates"], offsets=True)
+    return np.asarray(mdl["theta"], dtype=np.float32), epoch, offsets
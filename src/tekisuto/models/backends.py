@@ -0,0 +1,190 @@
+"""
+Registry of topic model backends for LatentSemantics
+"""
+import os
+import pickle
+
+import numpy as np
+from gensim import models
+
+# used when neither mallet_path nor the MALLET_PATH environment variable is set
+DEFAULT_MALLET = "/home/knielbo/Mallet/bin/mallet"
+
+BACKENDS = dict()
+
+
+def register_backend(name):
+    """ register fit(corpus, id2word, k, workers, **options) under name, the returned
+        model needs get_topics(), show_topics() and model[bow] like gensim's topic models
+    """
+    def register(fit):
+        BACKENDS[name] = fit
+        return fit
+    return register
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError("unknown backend {}, expected one of {}".format(name, sorted(BACKENDS)))
+    return BACKENDS[name]
+
+
+@register_backend("mallet")
+def fit_mallet(corpus, id2word, k, workers=8, mallet_path=None, **options):
+    """ Mallet through gensim's wrapper (gensim < 4), needs a JDK
+    """
+    from gensim.models.wrappers import LdaMallet
+    if mallet_path is None:
+        mallet_path = os.environ.get("MALLET_PATH", DEFAULT_MALLET)
+    settings = dict(optimize_interval=5, random_seed=41)
+    settings.update(options)
+    return LdaMallet(mallet_path, corpus=corpus, num_topics=k, id2word=id2word, workers=workers, **settings)
+
+
+@register_backend("ldamulticore")
+def fit_ldamulticore(corpus, id2word, k, workers=8, **options):
+    """ gensim's online variational Bayes, workers processes
+    """
+    settings = dict(passes=5, random_state=41)
+    settings.update(options)
+    return models.LdaMulticore(corpus, num_topics=k, id2word=id2word, workers=workers, **settings)
+
+
+@register_backend("lda")
+def fit_lda(corpus, id2word, k, workers=8, **options):
+    """ gensim's online variational Bayes in one process, supports alpha="auto"
+    """
+    settings = dict(passes=5, random_state=41)
+    settings.update(options)
+    return models.LdaModel(corpus, num_topics=k, id2word=id2word, **settings)
+
+
+@register_backend("gibbs")
+def fit_gibbs(corpus, id2word, k, workers=8, **options):
+    """ collapsed Gibbs sampler in numpy, one process
+    """
+    return GibbsLda(corpus, id2word, k, **options)
+
+
+class GibbsLda:
+    def __init__(self, corpus, id2word, num_topics, alpha=None, beta=0.01, iterations=200, random_state=41, blocksize=2 ** 16):
+        """
+        - corpus: iterable of bag-of-words documents
+        - id2word: gensim Dictionary
+        - num_topics: int
+        - alpha: float, symmetric document-topic prior, default 5 / num_topics (Mallet's default)
+        - beta: float, symmetric topic-word prior
+        - iterations: int, Gibbs sweeps over all tokens
+        - blocksize: int, number of tokens sampled at once
+
+        Samples the topic of every token given all other assignments, like Mallet without
+        hyperparameter optimization, so no corpus files or JVM are involved. Tokens are sampled
+        in blocks of blocksize as array operations, the tokens of one block see the counts from
+        before the block (as in parallel LDA samplers), every other token is up to date.
+        """
+        self.id2word = id2word
+        self.num_topics = num_topics
+        self.num_terms = len(id2word)
+        self.alpha = 5. / num_topics if alpha is None else alpha
+        self.beta = beta
+        self.iterations = iterations
+        self.blocksize = blocksize
+        self.random_state = np.random.RandomState(random_state)
+        self.train(corpus)
+
+    @staticmethod
+    def _tokens(corpus):
+        """ word id and document index of every token as int32 arrays
+        """
+        words, docs, lengths = list(), list(), list()
+        n_docs = 0
+        for d, bow in enumerate(corpus):
+            ids = np.array([w for w, _ in bow], dtype=np.int32)
+            counts = np.array([int(c) for _, c in bow], dtype=np.int64)
+            words.append(np.repeat(ids, counts))
+            lengths.append(int(counts.sum()))
+            n_docs = d + 1
+        words = np.concatenate(words) if words else np.zeros(0, dtype=np.int32)
+        docs = np.repeat(np.arange(n_docs, dtype=np.int32), lengths)
+        return words, docs, n_docs
+
+    def train(self, corpus):
+        words, docs, n_docs = self._tokens(corpus)
+        K, V = self.num_topics, self.num_terms
+        z = self.random_state.randint(K, size=len(words)).astype(np.int32)
+        ndk = np.zeros((n_docs, K), dtype=np.float64)
+        nwk = np.zeros((V, K), dtype=np.float64)
+        np.add.at(ndk, (docs, z), 1)
+        np.add.at(nwk, (words, z), 1)
+        nk = nwk.sum(axis=0)
+        vbeta = V * self.beta
+
+        for _ in range(self.iterations):
+            for start in range(0, len(words), self.blocksize):
+                w, d, old = words[start:start + self.blocksize], docs[start:start + self.blocksize], z[start:start + self.blocksize]
+                rows = np.arange(len(w))
+                # counts without the token itself
+                nd, nw, nkk = ndk[d], nwk[w], np.repeat(nk[None, :], len(w), axis=0)
+                nd[rows, old] -= 1
+                nw[rows, old] -= 1
+                nkk[rows, old] -= 1
+                cdf = np.cumsum((nd + self.alpha) * (nw + self.beta) / (nkk + vbeta), axis=1)
+                u = self.random_state.random_sample(len(w)) * cdf[:, -1]
+                new = np.minimum((cdf <= u[:, None]).sum(axis=1), K - 1).astype(np.int32)
+                np.add.at(ndk, (d, old), -1)
+                np.add.at(nwk, (w, old), -1)
+                np.add.at(ndk, (d, new), 1)
+                np.add.at(nwk, (w, new), 1)
+                nk += np.bincount(new, minlength=K) - np.bincount(old, minlength=K)
+                z[start:start + self.blocksize] = new
+
+        self.phi = ((nwk + self.beta) / (nk + vbeta)).T
+        self.theta = (ndk + self.alpha) / (ndk.sum(axis=1, keepdims=True) + K * self.alpha)
+
+    def get_topics(self):
+        """ topic-word probabilities, shape (num_topics, num_terms)
+        """
+        return self.phi
+
+    def inference(self, bow, iterations=50):
+        """ topic proportions of a new document with the topics held fixed
+        """
+        theta = np.full(self.num_topics, 1. / self.num_topics)
+        if not bow:
+            return theta
+        ids = np.array([w for w, _ in bow], dtype=np.int64)
+        counts = np.array([c for _, c in bow], dtype=np.float64)
+        phi = self.phi[:, ids]
+        for _ in range(iterations):
+            resp = theta[:, None] * phi
+            resp /= resp.sum(axis=0, keepdims=True)
+            theta = resp.dot(counts) + self.alpha
+            theta /= theta.sum()
+        return theta
+
+    def __getitem__(self, bow):
+        return list(enumerate(self.inference(bow).tolist()))
+
+    def show_topic(self, topicid, topn=10):
+        topic = self.phi[topicid]
+        return [(self.id2word[i], float(topic[i])) for i in np.argsort(topic)[::-1][:topn]]
+
+    def show_topics(self, num_topics=10, num_words=10, formatted=True):
+        if num_topics < 0 or num_topics > self.num_topics:
+            num_topics = self.num_topics
+        shown = list()
+        for i in range(num_topics):
+            topic = self.show_topic(i, topn=num_words)
+            if formatted:
+                topic = " + ".join('{:.3f}*"{}"'.format(p, w) for w, p in topic)
+            shown.append((i, topic))
+        return shown
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
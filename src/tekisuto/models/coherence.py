@@ -0,0 +1,303 @@
+"""
+Topic coherence from shared co-occurrence statistics
+"""
+import json
+import os
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+from gensim import corpora, matutils, utils
+from gensim.models.coherencemodel import COHERENCE_MEASURES, SLIDING_WINDOW_SIZES
+from gensim.topic_coherence.direct_confirmation_measure import EPSILON
+
+from tekisuto.datasets import TokenCorpus
+
+# measures that only need (co-)occurrence counts, c_w2v needs word vectors
+MEASURES = ("c_v", "c_uci", "c_npmi", "u_mass")
+INDEX_ARRAYS = ("offsets", "covered", "indptr", "positions")
+
+
+def topic_ids(model, topn=20):
+    """ top topn word ids of every topic of a fitted model, ordered as CoherenceModel orders them
+    """
+    return [matutils.argsort(topic, topn=topn, reverse=True).tolist() for topic in model.get_topics()]
+
+
+def token_ids(dictionary):
+    """ function mapping a list of tokens to their ids in dictionary, -1 for tokens not in it,
+        the ids of a HashDictionary are hashed, so it needs no stored words
+    """
+    if isinstance(dictionary, corpora.HashDictionary):
+        def ids(tokens):
+            return [dictionary.myhash(utils.to_utf8(token)) % dictionary.id_range for token in tokens]
+    else:
+        token2id = dictionary.token2id
+        def ids(tokens):
+            return [token2id.get(token, -1) for token in tokens]
+    return ids
+
+
+class CooccurrenceIndex:
+    def __init__(self, offsets, covered, indptr, positions):
+        """ positional index of a corpus in the id space of a dictionary, see build
+        - offsets: int64 array (n_docs + 1), text i covers the token positions offsets[i] to offsets[i + 1]
+        - covered: bool array (n_docs), whether a text has a word of the dictionary
+        - indptr, positions: postings, the positions of id i are positions[indptr[i]:indptr[i + 1]], ascending
+
+        The arrays may be memory-mapped (see load), counting reads the postings of the counted ids only.
+        """
+        self.offsets = offsets
+        self.covered = covered
+        self.indptr = indptr
+        self.positions = positions
+
+    @classmethod
+    def build(cls, texts, dictionary, path=None):
+        """ index texts in one pass
+        - texts: list of token lists or TokenCorpus
+        - dictionary: gensim Dictionary or HashDictionary of the topic models to score
+        - path: str, directory to write the index to, it is then memory-mapped, None to keep it in memory
+        """
+        lookup = token_ids(dictionary)
+        if isinstance(texts, TokenCorpus):
+            remap = np.array(lookup(texts.vocab), dtype=np.int64)
+            ids = remap[texts.ids] if len(remap) else np.zeros(0, dtype=np.int64)
+            offsets = np.asarray(texts.offsets, dtype=np.int64)
+        else:
+            ids, offsets = array("q"), array("q", [0])
+            for tokens in texts:
+                ids.extend(lookup(tokens))
+                offsets.append(len(ids))
+            ids, offsets = np.frombuffer(ids, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64)
+        known = ids >= 0
+        # stable sort keeps the positions of every id ascending, unknown tokens (-1) sort first
+        positions = np.argsort(ids, kind="stable")[len(ids) - int(known.sum()):]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(ids[known]))]).astype(np.int64)
+        total = np.concatenate([[0], np.cumsum(known)])
+        index = cls(offsets, total[offsets[1:]] > total[offsets[:-1]], indptr, positions)
+        if path is None:
+            return index
+        index.save(path)
+        return cls.load(path)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path):
+        return cls(*[np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in INDEX_ARRAYS])
+
+    def _window_starts(self, docs, window_size):
+        """ first and last window start of docs, texts shorter than window_size are one window,
+            window_size None makes every text one window (boolean document)
+        """
+        first = self.offsets[docs]
+        if window_size is None:
+            return first, first
+        return first, first + np.maximum(1, self.offsets[docs + 1] - first - window_size + 1) - 1
+
+    def num_docs(self, window_size=None):
+        """ number of windows of the texts with a word of the dictionary
+        """
+        first, last = self._window_starts(np.flatnonzero(self.covered), window_size)
+        return int((last - first + 1).sum())
+
+    def count(self, ids, rows, window_size=None, chunksize=2 ** 20):
+        """ number of windows in which ids[rows] and every word of ids occur together, the windows of
+            gensim's boolean sliding window (see num_docs), co-occurrences of a word with itself are its occurrences
+        - ids: array of int, dictionary ids
+        - rows: array of int, indices into ids of the words to count
+        - chunksize: int, about this many occurrences are counted at a time
+
+        returns a sparse matrix (len(rows), len(ids))
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        # ids beyond the postings never occur (e.g. unused hash ids)
+        indexed = ids < len(self.indptr) - 1
+        safe = np.where(indexed, ids, 0)
+        starts = np.where(indexed, self.indptr[safe], 0)
+        lengths = np.where(indexed, self.indptr[safe + 1], 0) - starts
+        column = np.repeat(np.arange(len(ids)), lengths)
+        gather = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+        position = np.asarray(self.positions[gather], dtype=np.int64)
+        order = np.argsort(position, kind="stable")
+        column, position = column[order], position[order]
+        doc = np.searchsorted(self.offsets, position, side="right") - 1
+        first, last = self._window_starts(doc, window_size)
+        # windows containing a token, start to end inclusive
+        start = first if window_size is None else np.maximum(first, position - window_size + 1)
+        end = np.minimum(position, last)
+        if not len(position):
+            return sp.csr_matrix((len(rows), len(ids)), dtype=np.int64)
+
+        select = sp.csr_matrix((np.ones(len(rows)), (np.arange(len(rows)), rows)), shape=(len(rows), len(ids)))
+        counts = sp.csr_matrix((len(rows), len(ids)), dtype=np.int64)
+        # chunks end at text boundaries, windows never cross them
+        cuts = np.searchsorted(position, self.offsets[doc[chunksize::chunksize]])
+        cuts = np.unique(np.concatenate([[0], cuts, [len(position)]]))
+        for lo, hi in zip(cuts[:-1], cuts[1:]):
+            counts = counts + self._count_chunk(column[lo:hi], start[lo:hi], end[lo:hi], len(ids), select)
+        return counts
+
+    @staticmethod
+    def _count_chunk(column, start, end, n_ids, select):
+        # windows of every word as disjoint runs, the window ends of a word ascend with its positions
+        order = np.lexsort((start, column))
+        column, start, end = column[order], start[order], end[order]
+        new = np.concatenate([[True], (column[1:] != column[:-1]) | (start[1:] > end[:-1] + 1)])
+        heads = np.flatnonzero(new)
+        run_column, run_start, run_end = column[heads], start[heads], np.maximum.reduceat(end, heads)
+        # segments between all run boundaries, every run covers whole segments
+        bounds = np.unique(np.concatenate([run_start, run_end + 1]))
+        lo, hi = np.searchsorted(bounds, run_start), np.searchsorted(bounds, run_end + 1)
+        spans = hi - lo
+        segment = np.repeat(lo - np.concatenate([[0], np.cumsum(spans)[:-1]]), spans) + np.arange(spans.sum())
+        run_column = np.repeat(run_column, spans)
+        words = sp.csr_matrix((np.ones(len(segment), dtype=np.int64), (segment, run_column)), shape=(len(bounds) - 1, n_ids))
+        # every segment weighted by its number of windows
+        weighted = sp.csr_matrix((np.diff(bounds)[segment], (segment, run_column)), shape=words.shape)
+        return (select @ weighted.T.tocsr()).astype(np.int64) @ words
+
+
+def c_v(counts, num_docs, topics):
+    """ c_v coherence (NPMI context vectors compared by cosine similarity, gamma 1) of topics,
+        vectorized per topic, gensim's indirect_confirmation_measure.cosine_similarity computes the same
+        - counts: array (n, n), window (co-)occurrence counts, occurrences on the diagonal
+        - num_docs: int, number of windows
+        - topics: list of int arrays, the columns of counts of the words of every topic
+    """
+    coherences = list()
+    for columns in topics:
+        joint = counts[np.ix_(columns, columns)] / float(num_docs)
+        single = np.diag(joint)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            npmi = np.log((joint + EPSILON) / np.outer(single, single)) / -np.log(joint + EPSILON)
+            # context vectors of every word against that of the whole topic
+            topic = npmi.sum(axis=0)
+            similarity = npmi.dot(topic) / (np.linalg.norm(npmi, axis=1) * np.linalg.norm(topic))
+        coherences.append(np.mean(similarity))
+    return float(np.mean(coherences))
+
+
+class _Counts:
+    """ (co-)occurrence counts of the words of scored topics, as gensim's confirmation measures read them
+    """
+    def __init__(self, counts, columns, num_docs):
+        self.counts = counts
+        self.columns = columns
+        self.num_docs = num_docs
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.counts[self.columns[key[0]], self.columns[key[1]]]
+        return self.counts[self.columns[key], self.columns[key]]
+
+
+class SharedCoherence:
+    def __init__(self, texts, dictionary, coherence="c_v", topn=20, window_size=None, path=None):
+        """
+        - texts: list of token lists or TokenCorpus
+        - dictionary: gensim Dictionary or HashDictionary of the topic models to score
+        - coherence: str, c_v, c_uci, c_npmi or u_mass, as for gensim's CoherenceModel
+        - topn, window_size: as for gensim's CoherenceModel
+        - path: str, directory of the on-disk co-occurrence index, None to keep it in memory
+
+        The word (co-)occurrence counts behind coherence do not depend on the topic model.
+        One pass over texts builds a positional index of the dictionary words (CooccurrenceIndex),
+        the words of every scored model are counted from the postings of the words not counted
+        before and scores are computed from those counts with gensim's confirmation measures.
+        Windows are counted exactly (gensim's sliding window can drop a word that is still in the window)
+        and num_docs counts the windows of every text with a word of the dictionary, so scores can
+        differ slightly from CoherenceModel's.
+        """
+        if coherence not in MEASURES:
+            raise ValueError("unknown coherence {}, expected one of {}".format(coherence, MEASURES))
+        self.texts = texts
+        self.dictionary = dictionary
+        self.coherence = coherence
+        self.topn = topn
+        # u_mass counts documents, as in CoherenceModel
+        self.window_size = None if coherence == "u_mass" else window_size or SLIDING_WINDOW_SIZES[coherence]
+        self.path = path
+        self.index = None
+        self.num_docs = None
+        # counted ids, their column in counts and their symmetric (co-)occurrence counts
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.columns = dict()
+        self.counts = sp.csr_matrix((0, 0), dtype=np.int64)
+
+    def build_index(self):
+        if self.index is None:
+            if self.texts is None:
+                raise ValueError("texts are needed to build the co-occurrence index")
+            self.index = CooccurrenceIndex.build(self.texts, self.dictionary, path=self.path)
+            self.num_docs = self.index.num_docs(self.window_size)
+        return self.index
+
+    def accumulate(self, topics):
+        """ count the words of topics (list of word id lists) that were not counted before
+        """
+        new = [i for i in dict.fromkeys(i for topic in topics for i in list(topic)[:self.topn]) if i not in self.columns]
+        if not new:
+            return
+        old = len(self.ids)
+        ids = np.concatenate([self.ids, np.array(new, dtype=np.int64)])
+        counts = self.build_index().count(ids, np.arange(old, len(ids)), window_size=self.window_size)
+        cross, block = counts[:, :old], counts[:, old:]
+        self.counts = sp.bmat([[self.counts, cross.T], [cross, block]], format="csr", dtype=np.int64)
+        self.ids = ids
+        self.columns.update((i, old + j) for j, i in enumerate(new))
+
+    def covers(self, topics):
+        """ True if all words of topics are counted
+        """
+        return all(i in self.columns for topic in topics for i in list(topic)[:self.topn])
+
+    def score(self, topics):
+        """ coherence of topics (list of word id lists, e.g. from topic_ids), only words
+            not counted before are read from the index
+        """
+        topics = [np.array(list(topic)[:self.topn]) for topic in topics]
+        if not self.covers(topics):
+            self.accumulate(topics)
+        # dense counts of the words of these topics only
+        words = list(dict.fromkeys(i for topic in topics for i in topic.tolist()))
+        columns = [self.columns[i] for i in words]
+        counts = _Counts(self.counts[columns][:, columns].toarray(), {i: j for j, i in enumerate(words)}, self.num_docs)
+        if self.coherence == "c_v":
+            return c_v(counts.counts, self.num_docs, [[counts.columns[i] for i in topic.tolist()] for topic in topics])
+        measure = COHERENCE_MEASURES[self.coherence]
+        kwargs = dict() if self.coherence == "u_mass" else dict(normalize=self.coherence == "c_npmi")
+        return measure.aggr(measure.conf(measure.seg(topics), counts, **kwargs))
+
+    def score_model(self, model):
+        return self.score(topic_ids(model, self.topn))
+
+    def save(self, path):
+        """ save the index and the counts to directory path, texts are not needed after loading
+        """
+        self.build_index()
+        if self.path is None or os.path.abspath(self.path) != os.path.abspath(path):
+            self.index.save(path)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        sp.save_npz(os.path.join(path, "counts.npz"), self.counts)
+        settings = {"coherence": self.coherence, "topn": self.topn, "window_size": self.window_size}
+        with open(os.path.join(path, "coherence.json"), "w") as f:
+            json.dump(settings, f)
+
+    @classmethod
+    def load(cls, path, texts=None, dictionary=None):
+        """ load a saved scorer, its index is memory-mapped
+        """
+        with open(os.path.join(path, "coherence.json")) as f:
+            settings = json.load(f)
+        scorer = cls(texts, dictionary, path=path, **settings)
+        scorer.index = CooccurrenceIndex.load(path)
+        scorer.num_docs = scorer.index.num_docs(scorer.window_size)
+        scorer.ids = np.load(os.path.join(path, "ids.npy"))
+        scorer.columns = {i: j for j, i in enumerate(scorer.ids.tolist())}
+        scorer.counts = sp.load_npz(os.path.join(path, "counts.npz")).tocsr()
+        return scorer
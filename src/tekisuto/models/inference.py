@@ -0,0 +1,100 @@
+"""
+Batched inference of document topic proportions (theta)
+"""
+from multiprocessing import Pool
+
+import numpy as np
+from gensim.models import LdaModel
+
+# model shared by the processes of a parallel inference, sent once per process
+_model = None
+
+
+def _init_worker(model, k):
+    global _model
+    _model = (model, k)
+
+
+def _work(chunk):
+    model, k = _model
+    return infer_chunk(model, chunk, k)
+
+
+def infer_chunk(model, chunk, k):
+    """ theta of a list of bag-of-words documents as a dense float32 (len(chunk), k) array
+    """
+    if isinstance(model, LdaModel):
+        # gensim's vectorized E-step, normalized as in get_document_topics but without dropping small topics
+        gamma, _ = model.inference(chunk)
+        return (gamma / gamma.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    theta = np.zeros((len(chunk), k), dtype=np.float32)
+    if hasattr(model, "mallet_path"):
+        # one Mallet inference run for the whole chunk
+        rows = model[chunk] if chunk else list()
+    else:
+        rows = [model[doc] for doc in chunk]
+    for i, row in enumerate(rows):
+        for topic, p in row:
+            theta[i, topic] = p
+    return theta
+
+
+def _chunks(corpus, chunksize):
+    chunk = list()
+    for doc in corpus:
+        chunk.append(doc)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+def infer_theta(model, corpus, k=None, chunksize=2000, workers=1, path=None, verbose=-1):
+    """ topic proportions of every document of corpus
+        - model: fitted topic model (gensim LdaModel/LdaMulticore, LdaMallet or a backend model with model[bow])
+        - corpus: iterable of bag-of-words documents with len(), e.g. list or MmCorpus, read once in chunks
+        - k: int, number of topics, default model.num_topics
+        - chunksize: int, number of documents per batch
+        - workers: int, number of processes (Mallet models always infer in one)
+        - path: str, write theta to a memory-mapped .npy file instead of keeping it in memory
+        - verbose: int, print progress every verbose documents, -1 to deactivate
+
+        returns a float32 array of shape (len(corpus), k), every row holds all k topics
+    """
+    if k is None:
+        k = model.num_topics
+    n = len(corpus)
+    if path is None:
+        theta = np.zeros((n, k), dtype=np.float32)
+    else:
+        theta = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, k))
+
+    if hasattr(model, "mallet_path"):
+        # Mallet writes its inference files to fixed paths under the model prefix
+        workers = 1
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_worker, initargs=(model, k))
+        batches = pool.imap(_work, _chunks(corpus, chunksize))
+    else:
+        pool = None
+        batches = (infer_chunk(model, chunk, k) for chunk in _chunks(corpus, chunksize))
+
+    try:
+        start = 0
+        for batch in batches:
+            theta[start:start + len(batch)] = batch
+            if verbose > 0 and (start + len(batch)) // verbose > start // verbose:
+                print("[INFO] processed {}/{}".format(start + len(batch), n))
+            start += len(batch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if start != n:
+        raise ValueError("corpus yielded {} documents but has length {}".format(start, n))
+    if path is not None:
+        theta.flush()
+    return theta
@@ -1,74 +1,279 @@
 """
 Class for estimation of information dynamics of time-dependent probabilistic document representations
 """
+from collections import deque
+
 import numpy as np
 from tekisuto.metrics import kld
+from tekisuto.metrics.banded import lag_bands, band_stats, kernel
+from tekisuto.tekiutil import date_buckets, bucket_start
+
+
+def calendar_bins(data, time, unit="day", lengths=None, offsets=None):
+    """ aggregate document representations into consecutive calendar bins
+        - data: array (m, k), e.g. theta, may be memory-mapped
+        - time: int64 epoch seconds or ISO 8601 strings, one per document
+        - unit: str, day, week, month or year (see tekiutil.date_buckets)
+        - lengths: list of int, number of tokens of every document, weights the mean, None for an unweighted mean,
+          bins whose documents have no tokens at all take the unweighted mean
+        - offsets: array of int, utc offsets of epoch time (see tekiutil.dates_to_epoch), bins follow the local
+          calendar of the documents, None for UTC bins
+
+        returns the binned data (n_bins, k) with NaN rows for bins without documents, the epoch seconds
+        of the start of every bin (local midnight, see tekiutil.bucket_start), and the number of documents per bin
+    """
+    buckets = date_buckets(time, unit, offsets=offsets)
+    data = np.asarray(data)
+    if not len(buckets):
+        return np.zeros((0,) + data.shape[1:]), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    weights = None if lengths is None else np.asarray(lengths, dtype=np.float64)
+    if np.any(buckets[1:] < buckets[:-1]):
+        order = np.argsort(buckets, kind="stable")
+        buckets, data = buckets[order], data[order]
+        weights = None if weights is None else weights[order]
+    # group by on sorted bucket ids, every group is a contiguous run of rows
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    sums = np.add.reduceat(data, starts, axis=0, dtype=np.float64)
+    totals = np.diff(np.append(starts, len(buckets))).astype(np.float64)
+    if weights is not None:
+        weighted = np.add.reduceat(weights, starts)
+        use = weighted > 0
+        sums[use] = np.add.reduceat(data * weights[:, None], starts, axis=0, dtype=np.float64)[use]
+        totals[use] = weighted[use]
+    ids = buckets[starts] - buckets[0]
+    binned = np.full((ids[-1] + 1, data.shape[1]), np.nan)
+    binned[ids] = sums / totals[:, None]
+    counts = np.zeros(ids[-1] + 1, dtype=np.int64)
+    counts[ids] = np.diff(np.append(starts, len(buckets)))
+    return binned, bucket_start(np.arange(buckets[0], buckets[-1] + 1), unit), counts
+
 
 class InfoDynamics:
-    def __init__(self, data, time, window=3, weight=0, sort=False):
+    def __init__(self, data, time, window=3, weight=0, sort=False, chunksize=10000, unit=None, lengths=None, offsets=None):
         """
         - data: list/array (of lists), bow representation of documents
         - time: list/array, time coordinate for each document (identical order as data)
-        - window: int, window to compute novelty, transience, and resonance over
+        - window: int, window to compute novelty, transience, and resonance over, or list of int
+          to compute several windows from one pass (signals become arrays (n_windows, m))
         - weight: int, parameter to set initial window for novelty and final window for transience
         - sort: bool, if time should be sorted in ascending order and data accordingly
+        - chunksize: int, number of documents per block of the divergence computation (see metrics.banded)
+        - unit: str, day, week, month or year, aggregate data into calendar bins (see calendar_bins),
+          window is then a number of units, windows skip empty bins and their signals are NaN
+        - lengths: list of int, number of tokens of every document, length-weighted bins instead of the mean
+        - offsets: array of int, utc offsets of every document for local calendar bins (see calendar_bins)
         """
         self.window = window
+        self.windows = np.atleast_1d(window).astype(int)
+        self.chunksize = chunksize
         self.weight = weight
-        if sort:
+        self.unit = unit
+        self.counts = None
+        if unit is not None:
+            # bins are in time order, sort is not needed
+            self.data, self.time, self.counts = calendar_bins(data, time, unit=unit, lengths=lengths, offsets=offsets)
+        elif sort:
             self.data = np.array([text for _,text in sorted(zip(time, data))])
             self.time = sorted(time)
         else:
             self.data = np.array(data)
             self.time = time
         self.m = self.data.shape[0]
+        self.meas = None
         
-    def novelty(self, meas=kld):
-        N_hat = np.zeros(self.m)
-        N_sd = np.zeros(self.m)
-        for i, x in enumerate(self.data):
-            submat = self.data[(i - self.window):i,]
-            tmp = np.zeros(submat.shape[0])
-            if submat.any():
-                for ii, xx in enumerate(submat):
-                    tmp[ii] = meas(x, xx)
-            else:
-                tmp = np.zeros([self.window]) + self.weight
-            
-            N_hat[i] = np.mean(tmp)
-            N_sd[i] = np.std(tmp)
+    def _window_nonzero(self, future=False):
+        """ whether the window of every document holds a non-zero row, (n_windows, m)
+        """
+        rows = self.data.any(axis=1)
+        if self.counts is not None:
+            rows &= self.counts > 0
+        nonzero = np.concatenate([[0], np.cumsum(rows)])
+        i = np.arange(self.m)
+        w = self.windows[:, None]
+        if future:
+            return nonzero[np.minimum(self.m, i + w + 1)] - nonzero[i + 1] > 0
+        return nonzero[i] - nonzero[np.maximum(0, i - w)] > 0
+
+    def _valid(self, future=False):
+        """ which neighbours in the lag band are bins with documents, None without bins
+        """
+        if self.counts is None:
+            return None
+        lags = np.arange(1, int(self.windows.max()) + 1)
+        j = np.arange(self.m)[:, None] + (lags if future else -lags)
+        inside = (j >= 0) & (j < self.m)
+        return inside & (self.counts[np.clip(j, 0, self.m - 1)] > 0)
+
+    def fit(self, meas=kld):
+        """ all signals (nsignal, tsignal, rsignal and their sigmas) from one evaluation of every
+            document pair in the (largest) window, novelty, transience and resonance read the results
+            - meas: divergence measure, e.g. kld or jsd
+
+        With a list of windows every signal is an array (n_windows, m), rows in the order of window.
+        """
+        past, future = lag_bands(self.data, int(self.windows.max()), meas, chunksize=self.chunksize)
+        self._novelty_from(past)
+        self._transience_from(future)
+        self._resonance_from()
+        if self.counts is not None:
+            for name in ("nsignal", "nsigma", "tsignal", "tsigma", "rsignal", "rsigma"):
+                getattr(self, name)[:, self.counts == 0] = np.nan
+        if np.ndim(self.window) == 0:
+            for name in ("nsignal", "nsigma", "tsignal", "tsigma", "rsignal", "rsigma"):
+                setattr(self, name, getattr(self, name)[0])
+        self.meas = meas
+        return self
+
+    compute_all = fit
+
+    def _novelty_from(self, band):
+        N_hat, N_sd = band_stats(band, np.repeat(self.windows[:, None], self.m, axis=1), self._valid())
+        # first window and windows of zero rows
+        empty = (np.arange(self.m) < self.windows[:, None]) | ~self._window_nonzero()
+        N_hat[empty] = self.weight
+        N_sd[empty] = 0
 
         self.nsignal = N_hat
         self.nsigma = N_sd
-    
-    def transience(self, meas=kld):
-        T_hat = np.zeros(self.m)
-        T_sd = np.zeros(self.m)
-        for i, x in enumerate(self.data):
-            submat = self.data[i+1:(i + self.window + 1),]
-            tmp = np.zeros(submat.shape[0])
-            if submat.any():
-                for ii, xx in enumerate(submat):
-                    tmp[ii] = meas(x, xx)
-            else:
-                tmp = np.zeros([self.window])
-            
-            T_hat[i] = np.mean(tmp)
-            T_hat[-self.window:] = np.zeros([self.window]) + self.weight
-            T_sd[i] = np.std(tmp)
+
+    def _transience_from(self, band):
+        # windows are cut short at the end of data
+        T_hat, T_sd = band_stats(band, np.minimum(self.windows[:, None], self.m - 1 - np.arange(self.m)), self._valid(future=True))
+        empty = ~self._window_nonzero(future=True)
+        T_hat[empty] = 0
+        T_sd[empty] = 0
+        for j, w in enumerate(self.windows):
+            T_hat[j, -w:] = self.weight
         
         self.tsignal = T_hat  
         self.tsigma = T_sd
 
-    def resonance(self, meas=kld):
-        self.novelty(meas)
-        self.transience(meas)
+    def _resonance_from(self):
         self.rsignal = self.nsignal - self.tsignal
-        self.rsignal[:self.window] = np.zeros([self.window]) + self.weight
-        self.rsignal[-self.window:] = np.zeros([self.window]) + self.weight
         self.rsigma = (self.nsigma + self.tsigma) / 2
-        self.rsigma[:self.window] = np.zeros([self.window]) + self.weight
-        self.rsigma[-self.window:] = np.zeros([self.window]) + self.weight
-        
-        
+        for j, w in enumerate(self.windows):
+            self.rsignal[j, :w] = self.weight
+            self.rsignal[j, -w:] = self.weight
+            self.rsigma[j, :w] = self.weight
+            self.rsigma[j, -w:] = self.weight
+
+    def _fitted(self, meas):
+        if self.meas is not meas:
+            self.fit(meas)
+
+    def novelty(self, meas=kld):
+        """ sets nsignal and nsigma, fits all signals unless fit already ran with meas
+        """
+        self._fitted(meas)
+
+    def transience(self, meas=kld):
+        """ sets tsignal and tsigma, see novelty
+        """
+        self._fitted(meas)
+
+    def resonance(self, meas=kld):
+        """ sets rsignal and rsigma, see novelty
+        """
+        self._fitted(meas)
+
+
+class StreamingInfoDynamics:
+    def __init__(self, window=3, weight=0, meas=kld):
+        """ online novelty, transience and resonance for documents arriving in time order,
+            with the edge handling of InfoDynamics and memory for window documents only
+        - window: int, window to compute novelty, transience, and resonance over
+        - weight: int, value of the initial and final windows, see InfoDynamics
+        - meas: divergence measure, e.g. kld or jsd
+
+        Every document gets a partial event (novelty) on arrival and a complete event (transience
+        and resonance) once window later documents have arrived, or at flush for the last ones.
+        Events are dicts with index, time, novelty, nsigma and complete, complete events add
+        transience, tsigma, resonance and rsigma.
+        """
+        self.window = window
+        self.weight = weight
+        self.meas = meas
+        self.prepare, self.pairs, self.symmetric = kernel(meas)
+        # the last window documents, waiting for their transience
+        self.buffer = deque(maxlen=window)
+        self.n = 0
+
+    def update(self, x, time=None):
+        """ add the next document
+        - x: list/array, theta of the document
+        - time: time coordinate of the document, passed on to its events
 
+        returns the list of new events, the partial event of x and the complete event of
+        the document window steps back (if any)
+        """
+        x = np.asarray(x, dtype=np.float64)[None, :]
+        doc = {
+            "index": self.n, "time": time, "rows": self.prepare(x), "nonzero": bool(x.any()),
+            "future": list(), "future_nonzero": False,
+            }
+        # prepared rows of the buffer from lag 1 to lag len(buffer), paired with x at once
+        past = [self.buffer[-lag] for lag in range(1, len(self.buffer) + 1)]
+        divergences = np.zeros(0)
+        if past:
+            stacked = tuple(np.concatenate([p["rows"][r] for p in past]) for r in range(len(doc["rows"])))
+            repeated = tuple(np.repeat(r, len(past), axis=0) for r in doc["rows"])
+            divergences = self.pairs(repeated, stacked)
+            reverse = divergences if self.symmetric else self.pairs(stacked, repeated)
+            for p, d in zip(past, reverse):
+                p["future"].append(d)
+                p["future_nonzero"] = p["future_nonzero"] or doc["nonzero"]
+
+        if self.n < self.window or not any(p["nonzero"] for p in past):
+            doc["novelty"], doc["nsigma"] = self.weight, 0.
+        else:
+            doc["novelty"], doc["nsigma"] = np.mean(divergences), np.std(divergences)
+        events = [self._event(doc)]
+        if len(self.buffer) == self.window:
+            events.append(self._complete(self.buffer[0]))
+        self.buffer.append(doc)
+        self.n += 1
+        return events
+
+    def flush(self):
+        """ end the stream, returns the complete events of the last documents (transience is
+            weight, tsigma is from the shorter window as in InfoDynamics) and resets the state
+        """
+        events = [self._complete(doc, final=True) for doc in self.buffer]
+        self.buffer.clear()
+        self.n = 0
+        return events
+
+    def process(self, stream):
+        """ generator of the events of an iterable of (time, theta) pairs, flushed at the end
+        """
+        for time, x in stream:
+            for event in self.update(x, time):
+                yield event
+        for event in self.flush():
+            yield event
+
+    async def aprocess(self, stream):
+        """ async generator of the events of an async iterable of (time, theta) pairs, e.g. a queue reader
+        """
+        async for time, x in stream:
+            for event in self.update(x, time):
+                yield event
+        for event in self.flush():
+            yield event
+
+    def _event(self, doc):
+        return {"index": doc["index"], "time": doc["time"], "novelty": doc["novelty"], "nsigma": doc["nsigma"], "complete": False}
+
+    def _complete(self, doc, final=False):
+        event = self._event(doc)
+        if doc["future"] and doc["future_nonzero"]:
+            transience, tsigma = np.mean(doc["future"]), np.std(doc["future"])
+        else:
+            transience, tsigma = 0., 0.
+        if final:
+            transience = self.weight
+        resonance, rsigma = doc["novelty"] - transience, (doc["nsigma"] + tsigma) / 2
+        if final or doc["index"] < self.window:
+            resonance, rsigma = self.weight, self.weight
+        event.update({"transience": transience, "tsigma": tsigma, "resonance": resonance, "rsigma": rsigma, "complete": True})
+        return event
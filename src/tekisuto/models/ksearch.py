@@ -0,0 +1,161 @@
+"""
+Search strategies over the number of topics
+"""
+import math
+
+import numpy as np
+
+STRATEGIES = ("grid", "golden", "halving", "early")
+
+
+def select_k(krange, cohers):
+    """ selection rule of the exhaustive grid search (reference)
+        - krange: list of int
+        - cohers: coherence of each k in krange
+    """
+    cohers = np.array(cohers, dtype=float)
+    idx =  cohers.argsort()[-len(krange):][::-1]
+    return krange[idx[np.argmax(cohers[idx]) & (np.gradient(cohers)[idx] >= 0)][0]]
+
+
+def subsample(n, fraction, seed=41):
+    """ sorted indices of a random fraction of n documents, the same for every call with the same arguments
+    """
+    if fraction >= 1.:
+        return np.arange(n)
+    size = max(1, int(round(fraction * n)))
+    return np.sort(np.random.RandomState(seed).choice(n, size=size, replace=False))
+
+
+def evaluator(fit, scorer, pool=None):
+    """ evaluate callable for KSearch
+        - fit: picklable callable(k, fraction) returning the topic word ids of a fitted model
+        - scorer: SharedCoherence, only the words it has not counted yet are read from its index
+        - pool: executor for concurrent fits, None to fit one k at a time
+    """
+    def evaluate(ks, fraction):
+        if pool is not None and len(ks) > 1:
+            k_topics = list(pool.map(fit, ks, [fraction] * len(ks)))
+        else:
+            k_topics = list()
+            for (i, k) in enumerate(ks):
+                print("[INFO] Estimating coherence model for k = {}, iteration {}".format(k, i))
+                k_topics.append(fit(k, fraction))
+        topics = [topic for topics in k_topics for topic in topics]
+        if not scorer.covers(topics):
+            scorer.accumulate(topics)
+        return [scorer.score(topics) for topics in k_topics]
+    return evaluate
+
+
+class KSearch:
+    def __init__(self, krange, evaluate, strategy="grid", batch=1, eta=3, min_fraction=0.1, patience=2, tol=0.):
+        """
+        - krange: list of int, candidate numbers of topics in ascending order
+        - evaluate: callable(ks, fraction), fits a model for every k in ks on a fraction of the corpus
+          and returns their coherence, gets all ks that can be fit concurrently at once
+        - strategy: str, one of
+            grid: every k on the full corpus, selected with select_k
+            golden: golden-section search over krange, assumes coherence is unimodal in k
+            halving: successive halving, all k on a min_fraction subsample, the best 1/eta
+              on eta times as many documents and so on until the full corpus
+            early: k in ascending order until coherence has not improved by more than tol
+              for patience consecutive k
+        - batch: int, number of k evaluated at a time by the early stopping search
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError("unknown search strategy {}, expected one of {}".format(strategy, STRATEGIES))
+        self.krange = list(krange)
+        self.evaluate = evaluate
+        self.strategy = strategy
+        self.batch = max(1, batch)
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.patience = patience
+        self.tol = tol
+        self.scores = dict()
+
+    def score(self, ks, fraction=1.):
+        """ coherence of every k in ks, models are only fit for (k, fraction) not seen before
+        """
+        todo = sorted({k for k in ks if (k, fraction) not in self.scores})
+        if todo:
+            for k, coher in zip(todo, self.evaluate(todo, fraction)):
+                self.scores[(k, fraction)] = coher
+        return [self.scores[(k, fraction)] for k in ks]
+
+    def cohers(self):
+        """ coherence on the full corpus for every k in krange, nan where no model was fit
+        """
+        return np.array([self.scores.get((k, 1.), np.nan) for k in self.krange], dtype=float)
+
+    def best(self):
+        """ k with the highest coherence on the full corpus
+        """
+        cohers = self.cohers()
+        return self.krange[int(np.nanargmax(cohers))]
+
+    def grid(self):
+        return select_k(self.krange, self.score(self.krange))
+
+    def golden(self):
+        invphi = (math.sqrt(5) - 1) / 2
+        lo, hi = 0, len(self.krange) - 1
+        while hi - lo > 2:
+            a = hi - int(round((hi - lo) * invphi))
+            b = lo + int(round((hi - lo) * invphi))
+            if a >= b:
+                a, b = b - 1, b
+            score_a, score_b = self.score([self.krange[a], self.krange[b]])
+            if score_a >= score_b:
+                hi = b
+            else:
+                lo = a
+        self.score(self.krange[lo:hi + 1])
+        return self.best()
+
+    def halving(self):
+        rungs = max(1, int(math.floor(math.log(1. / self.min_fraction, self.eta))) + 1)
+        candidates = list(self.krange)
+        for rung in range(rungs):
+            fraction = float(self.eta) ** (rung - rungs + 1)
+            scores = self.score(candidates, fraction)
+            if rung < rungs - 1:
+                keep = max(1, int(math.ceil(len(candidates) / self.eta)))
+                order = np.argsort(scores)[::-1][:keep]
+                candidates = sorted(candidates[i] for i in order)
+        return self.best()
+
+    def early(self):
+        best = -np.inf
+        stale = 0
+        for start in range(0, len(self.krange), self.batch):
+            for coher in self.score(self.krange[start:start + self.batch]):
+                if coher > best + self.tol:
+                    best = coher
+                    stale = 0
+                else:
+                    stale += 1
+            if stale >= self.patience:
+                break
+        return self.best()
+
+    def run(self):
+        """ returns the selected k
+        """
+        self.k = getattr(self, self.strategy)()
+        return self.k
+
+    def report(self):
+        """ number of fits against the exhaustive grid
+        """
+        fits = len(self.scores)
+        full = sum(1 for (_, fraction) in self.scores if fraction >= 1.)
+        return {
+            "strategy": self.strategy,
+            "k": self.k,
+            "fits": fits,
+            "full_corpus_fits": full,
+            "grid_fits": len(self.krange),
+            "saved": len(self.krange) - full,
+            }
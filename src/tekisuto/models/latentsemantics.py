@@ -2,13 +2,63 @@
 Class for training latent semantic models
 """
 #import pandas as pd
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import gensim
 import gensim.corpora as corpora
-from gensim.models import CoherenceModel
+from scipy.optimize import linear_sum_assignment
+
+from tekisuto.datasets import TokenCorpus
+from tekisuto.metrics import jsd
+from tekisuto.tekiutil import split_cores
+from .coherence import SharedCoherence, topic_ids
+from .ksearch import KSearch, evaluator, subsample
+from .backends import get_backend
+from .inference import infer_theta
+from .vocabulary import bounded_dictionary, hash_dictionary, ID_RANGE
+
+# texts, dictionary and corpus shared by the processes of a k search
+_grid = None
+
+
+def _init_grid(texts, id2word, corpus, backend, options, workers):
+    global _grid
+    _grid = (texts, id2word, corpus, backend, options, workers)
+
+
+def _fit_k(k, fraction=1.):
+    texts, id2word, corpus, backend, options, workers = _grid
+    ls = LatentSemantics(texts, k=k, workers=workers, backend=backend, **options)
+    ls.id2word = id2word
+    ls.corpus = corpus if fraction >= 1. else [corpus[i] for i in subsample(len(corpus), fraction)]
+    ls.fit(coherence=False)
+    return topic_ids(ls.model)
+
+
+def topic_drift(before, after, align=False):
+    """ mean Jensen-Shannon divergence between the rows of two topic-word matrices
+        - align: bool, match topics by minimum total divergence first (Hungarian matching),
+          needed after a retrain, whose topic numbering is arbitrary
+    """
+    if not align:
+        return float(np.mean([jsd(p, q) for p, q in zip(before, after)]))
+    cost = np.array([[jsd(p, q) for q in after] for p in before])
+    rows, cols = linear_sum_assignment(cost)
+    return float(cost[rows, cols].mean())
+
 
 class LatentSemantics:
-    def __init__(self, texts, titles=False, k=2, mallet_path="/home/knielbo/Mallet/bin/mallet"):
+    def __init__(self, texts, titles=False, k=2, mallet_path=None, workers=8, backend="mallet", **options):
+        """
+        - texts: list of token lists or TokenCorpus
+        - mallet_path: str, Mallet binary, default $MALLET_PATH (mallet backend only)
+        - workers: int, number of threads/processes per model fit
+        - backend: str, topic model backend, see tekisuto.models.backends.BACKENDS
+          (mallet, ldamulticore, lda, gibbs)
+        - **options: settings passed on to the backend
+        """
 
         self.texts = texts
 
@@ -18,41 +68,191 @@ class LatentSemantics:
             self.titles = ["text_{}".format(i) for i in range(len(texts))]
         
         self.mallet = mallet_path
+        self.backend = backend
+        self.options = options
         self.k = k
+        self.workers = workers
+        self.id2word = None
+        self.corpus = None
+        self.scorer = None
+
+    def generate_id2word(self, no_below=None, no_above=None, keep_n=None, hashing=None, vocabulary="exact", memory=2 ** 30):
+        """ dictionary of self.texts in one pass, filtered with filter_extremes if any of
+            no_below, no_above and keep_n is set
+            - hashing: int, id range of a HashDictionary instead, words first seen in later updates
+              also get an id (gensim backends only)
+            - vocabulary: str, exact (count every word), sketch (approximate pre-pass decides which words
+              are counted exactly, two passes) or hash (HashDictionary without stored words, hashing ids,
+              default vocabulary.ID_RANGE)
+            - memory: int, bytes available to the sketch vocabulary
+        """
+        if vocabulary == "sketch" and hashing is not None:
+            raise ValueError("hashing replaces the sketch vocabulary, use one of them")
+        if vocabulary == "hash":
+            id2word = hash_dictionary(self.texts, id_range=ID_RANGE if hashing is None else hashing)
+        elif hashing is not None:
+            id2word = hash_dictionary(self.texts, id_range=hashing, debug=True)
+        elif vocabulary == "sketch":
+            id2word = bounded_dictionary(self.texts, memory=memory, no_below=1 if no_below is None else no_below)
+        elif vocabulary != "exact":
+            raise ValueError("unknown vocabulary {}, expected exact, sketch or hash".format(vocabulary))
+        elif isinstance(self.texts, TokenCorpus):
+            id2word = self.texts.to_dictionary()
+        else:
+            id2word = corpora.Dictionary(self.texts)
+        if no_below is not None or no_above is not None or keep_n is not None:
+            id2word.filter_extremes(
+                no_below=1 if no_below is None else no_below,
+                no_above=1. if no_above is None else no_above,
+                keep_n=keep_n
+                )
+        return id2word
 
-    def generate_id2word(self):
-        return corpora.Dictionary(self.texts)
+    def generate_corpus(self, id2word=None):
+        """ generator of bag-of-words documents
+        """
+        if id2word is None:
+            id2word = self.generate_id2word()
+        if isinstance(self.texts, TokenCorpus) and isinstance(id2word, corpora.Dictionary):
+            return self.texts.bows(id2word)
+        return (id2word.doc2bow(text) for text in self.texts)
 
-    def generate_corpus(self):
-        id2word = self.generate_id2word()
-        return [id2word.doc2bow(text) for text in self.texts]
+    def build_corpus(self, path=None, no_below=None, no_above=None, keep_n=None, hashing=None, vocabulary="exact", memory=2 ** 30):
+        """ build dictionary and bow corpus once, later fits reuse them
+            - path: str, stream the corpus to an indexed Matrix Market file instead of keeping it in memory,
+              fits read it from disk
+            - no_below, no_above, keep_n: dictionary filtering, see gensim's Dictionary.filter_extremes
+            - hashing: int, hash words to this many ids, see generate_id2word
+            - vocabulary, memory: bounded-memory vocabularies, see generate_id2word
+        """
+        if self.id2word is None:
+            self.id2word = self.generate_id2word(no_below=no_below, no_above=no_above, keep_n=keep_n, hashing=hashing, vocabulary=vocabulary, memory=memory)
+            self.corpus = None
+        if self.corpus is None:
+            if path is None:
+                self.corpus = list(self.generate_corpus(self.id2word))
+            else:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                corpora.MmCorpus.serialize(path, self.generate_corpus(self.id2word), id2word=self.id2word)
+                self.corpus = corpora.MmCorpus(path)
     
-    def fit(self):
-        self.id2word = self.generate_id2word()
-        self.corpus = self.generate_corpus()
-        self.model = gensim.models.wrappers.LdaMallet(self.mallet,
-                                                 corpus=self.corpus,
-                                                 num_topics=self.k,
-                                                 id2word=self.id2word,
-                                                 workers=8,
-                                                 optimize_interval=5,
-                                                 random_seed=41
-                                                 )
-        self.coherencemodel = CoherenceModel(model=self.model, texts=self.texts, dictionary=self.id2word, coherence="c_v")
-        self.coherence = self.coherencemodel.get_coherence()
+    def coherence_scorer(self, path=None):
+        """ c_v scorer over self.texts, its co-occurrence counts are shared by all fits
+            - path: str, directory of its on-disk co-occurrence index, None to keep it in memory
+        """
+        if self.scorer is None:
+            self.build_corpus()
+            self.scorer = SharedCoherence(self.texts, self.id2word, coherence="c_v", path=path)
+        return self.scorer
+
+    def backend_options(self):
+        options = dict(self.options)
+        if self.backend == "mallet" and self.mallet is not None:
+            options["mallet_path"] = self.mallet
+        return options
+
+    def fit(self, coherence=True, sample=None):
+        """
+        - coherence: bool, score the fitted model (self.coherence)
+        - sample: array of int, train on these documents only (see sampling.stratified_sample),
+          theta is still inferred for the full corpus with self.theta()
+        """
+        self.build_corpus()
+        corpus = self.corpus if sample is None else [self.corpus[i] for i in sample]
+        self.model = get_backend(self.backend)(corpus, self.id2word, self.k, workers=self.workers, **self.backend_options())
+        if coherence:
+            self.coherence = self.coherence_scorer().score_model(self.model)
     
-    def coherence_k(self, krange=[10,20,30,40,50], texts=False):
-        k_cohers = list()
-        for (i, k) in enumerate(krange):
-            print("[INFO] Estimating coherence model for k = {}, iteration {}".format(k, i))
-            ls = LatentSemantics(self.texts, k=k)
-            ls.fit()
-            #k_cohers.append((k, ls.coherence))
-            k_cohers.append(ls.coherence)
-
-
-        k_cohers = np.array(k_cohers, dtype=np.float)
-        idx =  k_cohers.argsort()[-len(krange):][::-1]
-        k = krange[idx[np.argmax(k_cohers[idx]) & (np.gradient(k_cohers)[idx] >= 0)][0]]
-        
-        return k, k_cohers
\ No newline at end of file
+    def theta(self, corpus=None, **kwargs):
+        """ topic proportions of every document of corpus (default self.corpus) as a float32 array
+            - **kwargs: see tekisuto.models.inference.infer_theta
+        """
+        if corpus is None:
+            corpus = self.corpus
+        return infer_theta(self.model, corpus, **kwargs)
+
+    def update(self, texts, max_drift=0.05, max_oov=None):
+        """ add new documents to a fitted model
+            - texts: list of token lists
+            - max_drift: float, retrain from scratch on all documents if the mean Jensen-Shannon divergence
+              between the topics before and after the update exceeds it
+            - max_oov: float, also retrain if the share of out-of-vocabulary tokens exceeds it, None to ignore
+
+        Backends with an online update (lda, ldamulticore) are updated with the new documents only,
+        others (mallet, gibbs) are always retrained, with a warning. self.drift is the drift of the
+        update, or after a retrain the drift between topics matched by topic_drift. The vocabulary is fixed, unknown words are dropped (self.oov is their share),
+        unless the corpus was built with hashing. Retraining reuses the vocabulary, rebuild the
+        dictionary from all texts to extend it.
+
+        returns the theta of the new documents and whether the model was retrained, in which case
+        the theta of the earlier documents has changed as well
+        """
+        bows = [self.id2word.doc2bow(text) for text in texts]
+        n_tokens = sum(len(text) for text in texts)
+        known = sum(count for bow in bows for _, count in bow)
+        self.oov = 1. - known / n_tokens if n_tokens else 0.
+        print("[INFO] {} new documents, {:.2f}% out-of-vocabulary tokens".format(len(bows), 100 * self.oov))
+
+        self.append_corpus(bows)
+        self.scorer = None
+        before = self.model.get_topics()
+        retrain = max_oov is not None and self.oov > max_oov
+        if not hasattr(self.model, "update"):
+            print("[INFO] warning: {} models have no online update, the model is retrained on all documents".format(type(self.model).__name__))
+            retrain = True
+        if not retrain:
+            self.model.update(bows)
+            self.drift = topic_drift(before, self.model.get_topics())
+            print("[INFO] topic drift {:.4f} (threshold {})".format(self.drift, max_drift))
+            retrain = self.drift > max_drift
+        if retrain:
+            print("[INFO] retraining on all {} documents".format(len(self.corpus)))
+            self.fit(coherence=False)
+            self.drift = topic_drift(before, self.model.get_topics(), align=True)
+            print("[INFO] topic drift of the retrained model {:.4f} (topics matched)".format(self.drift))
+        return self.theta(bows), retrain
+
+    def append_corpus(self, bows):
+        """ append bag-of-words documents to self.corpus, an on-disk corpus is rewritten in one streaming pass
+        """
+        if isinstance(self.corpus, corpora.MmCorpus):
+            path = self.corpus.input
+            root, ext = os.path.splitext(path)
+            tmp = "{}.tmp{}".format(root, ext)
+            corpora.MmCorpus.serialize(tmp, itertools.chain(self.corpus, bows), id2word=self.id2word)
+            os.replace(tmp + ".index", path + ".index")
+            os.replace(tmp, path)
+            self.corpus = corpora.MmCorpus(path)
+        else:
+            self.corpus = list(self.corpus) + bows
+
+    def coherence_k(self, krange=[10,20,30,40,50], texts=False, cores=None, strategy="grid", **search):
+        """
+        - cores: int, total number of cores for the search, split between
+          concurrent fits (over k) and self.workers threads per fit, None for all
+        - strategy: str, grid|golden|halving|early, see KSearch
+        - **search: settings of the search strategy, see KSearch
+
+        returns the selected k and the coherence of every k in krange (nan if not fit on the full corpus),
+        the search with its report is kept as self.ksearch
+        """
+        self.build_corpus()
+        outer, inner = split_cores(cores, len(krange), inner=self.workers)
+        print("[INFO] Estimating coherence models for k in {} ({} search), {} at a time with {} workers each".format(krange, strategy, outer, inner))
+        initargs = (self.texts, self.id2word, self.corpus, self.backend, self.backend_options(), inner)
+        pool = ProcessPoolExecutor(outer, initializer=_init_grid, initargs=initargs) if outer > 1 else None
+        # single fits run in this process
+        _init_grid(*initargs)
+        try:
+            self.ksearch = KSearch(krange, evaluator(_fit_k, self.coherence_scorer(), pool), strategy=strategy, batch=outer, **search)
+            k = self.ksearch.run()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        report = self.ksearch.report()
+        print("[INFO] {} models fit ({} on the full corpus), {} full fits saved against the grid of {}".format(
+            report["fits"], report["full_corpus_fits"], report["saved"], report["grid_fits"]))
+
+        return k, self.ksearch.cohers()
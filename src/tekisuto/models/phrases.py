@@ -0,0 +1,71 @@
+"""
+Cached, streaming bigram phrase detection
+"""
+import os
+import json
+import hashlib
+
+from gensim import models
+
+# gensim 3 joins phrase tokens with a bytes delimiter
+DELIMITER = b" "
+
+
+def corpus_fingerprint(texts):
+    """ content hash of a corpus of token lists (TokenCorpus has its own, faster fingerprint)
+    """
+    if hasattr(texts, "fingerprint"):
+        return texts.fingerprint()
+    h = hashlib.sha1()
+    for tokens in texts:
+        h.update("\0".join(tokens).encode("utf-8"))
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+def train_phraser(texts, cache=None, min_count=5, threshold=10.0, max_vocab_size=40000000):
+    """ bigram phraser trained in one streaming pass over texts
+        - texts: iterable of token lists (re-iterable when cache is set)
+        - cache: str, directory where phrasers are kept under the corpus fingerprint and settings,
+          a phraser for the same corpus and settings is loaded instead of trained
+        - min_count, threshold: see gensim's Phrases
+        - max_vocab_size: int, maximum number of unigrams and bigrams counted, rarer ones are pruned
+          when the table outgrows it, bounds memory on large corpora
+    """
+    settings = dict(min_count=min_count, threshold=threshold, max_vocab_size=max_vocab_size)
+    path = None
+    if cache is not None:
+        key = hashlib.sha1("{}\0{}\0{!r}".format(
+            corpus_fingerprint(texts), json.dumps(settings, sort_keys=True), DELIMITER
+            ).encode("utf-8")).hexdigest()
+        path = os.path.join(cache, "phrases-{}.pkl".format(key))
+        if os.path.isfile(path):
+            print("[INFO] loading phrases from {}".format(path))
+            return models.phrases.Phraser.load(path)
+
+    phrases = models.Phrases(texts, delimiter=DELIMITER, **settings)
+    phraser = models.phrases.Phraser(phrases)
+    if path is not None:
+        os.makedirs(cache, exist_ok=True)
+        phraser.save(path)
+    return phraser
+
+
+class PhrasedCorpus:
+    def __init__(self, texts, phraser):
+        """ lazy corpus transform, every document of texts is phrased when it is read
+            - texts: list of token lists or TokenCorpus
+            - phraser: trained phraser, see train_phraser
+        """
+        self.texts = texts
+        self.phraser = phraser
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        for tokens in self.texts:
+            yield self.phraser[list(tokens)]
+
+    def __getitem__(self, i):
+        return self.phraser[list(self.texts[i])]
@@ -0,0 +1,85 @@
+"""
+Stratified training samples and their comparison with full-corpus fits
+"""
+import numpy as np
+
+from tekisuto.tekiutil import date_buckets
+from tekisuto.metrics import jsd
+from .infodynamics import InfoDynamics
+
+
+def stratified_sample(dates, sources=None, budget_docs=None, budget_tokens=None, lengths=None, bucket="month", seed=41, offsets=None):
+    """ sorted indices of a training sample with the same share of every stratum (date bucket and source)
+        - dates: int64 epoch seconds or ISO 8601 strings, one per document
+        - sources: list, source of every document, None for a single source
+        - budget_docs: int, number of sampled documents
+        - budget_tokens: int, number of sampled tokens (instead of budget_docs), needs lengths
+        - lengths: list of int, number of tokens of every document
+        - bucket: str, see date_buckets
+        - offsets: array of int, utc offsets of epoch dates for local calendar buckets, see date_buckets
+    """
+    buckets = date_buckets(dates, bucket, offsets=offsets)
+    n = len(buckets)
+    if sources is None:
+        strata = buckets
+    else:
+        _, source_ids = np.unique(np.asarray(sources), return_inverse=True)
+        strata = buckets * (source_ids.max() + 1) + source_ids
+    _, inverse = np.unique(strata, return_inverse=True)
+    rng = np.random.RandomState(seed)
+
+    if budget_tokens is not None:
+        if lengths is None:
+            raise ValueError("budget_tokens needs the document lengths")
+        lengths = np.asarray(lengths, dtype=np.int64)
+        fraction = min(1., budget_tokens / max(1, lengths.sum()))
+    elif budget_docs is not None:
+        fraction = min(1., budget_docs / max(1, n))
+    else:
+        raise ValueError("set budget_docs or budget_tokens")
+    if fraction >= 1.:
+        return np.arange(n)
+
+    sizes = np.bincount(inverse)
+    if budget_tokens is None:
+        # largest remainder allocation, the sample has exactly budget_docs documents
+        quota = sizes * fraction
+        take = np.floor(quota).astype(np.int64)
+        rest = int(budget_docs) - take.sum()
+        take[np.argsort(take - quota, kind="stable")[:rest]] += 1
+
+    sample = list()
+    for stratum in range(len(sizes)):
+        members = np.flatnonzero(inverse == stratum)
+        rng.shuffle(members)
+        if budget_tokens is None:
+            sample.append(members[:take[stratum]])
+        else:
+            cumulative = np.cumsum(lengths[members])
+            stop = int(np.searchsorted(cumulative, fraction * cumulative[-1], side="left")) + 1
+            sample.append(members[:min(stop, len(members))])
+    return np.sort(np.concatenate(sample))
+
+
+def compare_signals(theta, reference, window, meas=jsd, time=None, unit=None, offsets=None):
+    """ agreement of the novelty and resonance signals of theta with those of a reference theta
+        (e.g. sample-trained against full-corpus model), documents in date order
+        - window: int, window of the compared signals, use the window of the production signal
+        - time, unit, offsets: dates, calendar unit and utc offsets for calendar-time windows, see InfoDynamics
+    """
+    report = dict()
+    signals = list()
+    for data in (theta, reference):
+        idmdl = InfoDynamics(data=data, time=time, window=window, unit=unit, offsets=offsets)
+        idmdl.fit(meas=meas)
+        signals.append(idmdl)
+    for name in ("nsignal", "rsignal"):
+        a, b = getattr(signals[0], name), getattr(signals[1], name)
+        # empty calendar bins have no signal
+        finite = np.isfinite(a) & np.isfinite(b)
+        a, b = a[finite], b[finite]
+        report[name] = {
+            "pearson": float(np.corrcoef(a, b)[0, 1]),
+            "mean_absolute_error": float(np.mean(np.abs(a - b))),
+            }
+    return report
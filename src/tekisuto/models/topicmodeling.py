@@ -1,20 +1,54 @@
 """
 Topic model class
 """
-import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
 import matplotlib.pyplot as plt
 
 from gensim import models, corpora
-from gensim.models.coherencemodel import CoherenceModel
+
+from tekisuto.datasets import TokenCorpus
+from tekisuto.tekiutil import split_cores
+from .coherence import SharedCoherence, topic_ids
+from .ksearch import KSearch, evaluator, subsample
+from .inference import infer_theta
+from .phrases import PhrasedCorpus, train_phraser
+from .vocabulary import bounded_dictionary, hash_dictionary, ID_RANGE
+
+CORPUS_ARGS = ("no_below", "no_above", "keep_n", "keep_tokens", "remove_most_freq_n", "bad_tokens", "bigrams", "phrase_cache", "phrase_vocab_size", "vocabulary", "memory", "id_range")
+
+# corpus and model settings shared by the processes of a topic number search
+_grid = None
+
+
+def _init_grid(tokenlists, dictionary, bows, model, kwargs):
+    global _grid
+    _grid = (tokenlists, dictionary, bows, model, kwargs)
+
+
+def _fit_topics(n, fraction=1.):
+    tokenlists, dictionary, bows, model, kwargs = _grid
+    tm = TopicModel(tokenlists)
+    tm.dictionary = dictionary
+    tm.bows = bows if fraction >= 1. else [bows[i] for i in subsample(len(bows), fraction)]
+    tm.fit_model(n, model=model, **kwargs)
+    return topic_ids(tm.model)
 
 class TopicModel():
     """
     Shamelessly stolen/slightly modified from TextToX
     """
     def __init__(self, tokenlists):
+        """
+        - tokenlists: list of token lists or TokenCorpus
+        """
         self.tokenlists = tokenlists
+        # corpus the models see, self.tokenlists or a lazily phrased view of it
+        self.texts = tokenlists
+        self.phraser = None
+        self.scorer = None
     
     def fit(
         self,
@@ -27,6 +61,11 @@ class TopicModel():
         bad_tokens=None,
         model="ldamulticore",
         bigrams=True,
+        phrase_cache=None,
+        phrase_vocab_size=40000000,
+        vocabulary="exact",
+        memory=2 ** 30,
+        id_range=ID_RANGE,
         **kwargs,
         ):
         """
@@ -41,22 +80,86 @@ class TopicModel():
         dictionary after filtering.
         remove_most_freq_n (int|None): Remove n most frequent tokens
         model ('ldamulticore'|'lda'|'ldamallet')
+        sample (array of int|None): train on a subsample, see fit_model
+        bigrams (bool): detect bigram phrases, the phrase model is trained once
+        phrase_cache (str|None): directory where phrase models are kept under
+        the corpus fingerprint, later runs on the same corpus load them
+        phrase_vocab_size (int): maximum number of unigrams and bigrams counted
+        for phrase detection, bounds its memory
+        vocabulary ('exact'|'sketch'|'hash'): exact counts every word, sketch
+        decides which words are counted exactly in an approximate pre-pass
+        (count-min sketch and SpaceSaving), hash uses a HashDictionary, which
+        stores no words, so its ids are not filtered
+        memory (int): bytes available to the sketch vocabulary
+        id_range (int): number of ids of the hash vocabulary
+        """
+        self.build_corpus(
+            no_below=no_below,
+            no_above=no_above,
+            keep_n=keep_n,
+            keep_tokens=keep_tokens,
+            remove_most_freq_n=remove_most_freq_n,
+            bad_tokens=bad_tokens,
+            bigrams=bigrams,
+            phrase_cache=phrase_cache,
+            phrase_vocab_size=phrase_vocab_size,
+            vocabulary=vocabulary,
+            memory=memory,
+            id_range=id_range,
+        )
+        self.fit_model(num_topics, model=model, **kwargs)
+
+    def build_corpus(
+        self,
+        no_below=1,
+        no_above=0.9,
+        keep_n=None,
+        keep_tokens=None,
+        remove_most_freq_n=None,
+        bad_tokens=None,
+        bigrams=True,
+        phrase_cache=None,
+        phrase_vocab_size=40000000,
+        vocabulary="exact",
+        memory=2 ** 30,
+        id_range=ID_RANGE,
+        ):
+        """
+        phrase detection, dictionary and bag-of-words corpus, see fit
         """
         if bigrams:
-            phrases = models.Phrases(self.tokenlists, delimiter=b" ")
-            phraser = models.phrases.Phraser(phrases)
-            self.tokenlists = [phraser[tl] for tl in self.tokenlists]
+            settings = (phrase_cache, phrase_vocab_size)
+            if self.phraser is None or self.phraser_settings != settings:
+                self.phraser = train_phraser(self.tokenlists, cache=phrase_cache, max_vocab_size=phrase_vocab_size)
+                self.phraser_settings = settings
+            self.texts = PhrasedCorpus(self.tokenlists, self.phraser)
+        else:
+            self.texts = self.tokenlists
 
-        dictionary = corpora.Dictionary(self.tokenlists)
+        if vocabulary == "sketch":
+            dictionary = bounded_dictionary(self.texts, memory=memory, no_below=no_below or 1)
+        elif vocabulary == "hash":
+            if remove_most_freq_n or keep_tokens or bad_tokens:
+                raise ValueError("the hash vocabulary stores no words, remove_most_freq_n, keep_tokens and bad_tokens need another vocabulary")
+            dictionary = hash_dictionary(self.texts, id_range=id_range)
+        elif isinstance(self.texts, TokenCorpus):
+            dictionary = self.texts.to_dictionary()
+        else:
+            dictionary = corpora.Dictionary(self.texts)
         self.dictionary = dictionary
 
         if remove_most_freq_n:
             dictionary.filter_n_most_frequent(remove_most_freq_n)
-        dictionary.filter_extremes(
-            no_below=no_below, no_above=no_above, keep_n=keep_n, keep_tokens=keep_tokens
-        )
+        # hashed ids have no word counts to filter, doc2bow keeps every id
+        if vocabulary != "hash":
+            dictionary.filter_extremes(
+                no_below=no_below, no_above=no_above, keep_n=keep_n, keep_tokens=keep_tokens
+            )
 
-        bows = [dictionary.doc2bow(tl) for tl in self.tokenlists]
+        if isinstance(self.texts, TokenCorpus) and isinstance(dictionary, corpora.Dictionary):
+            bows = list(self.texts.bows(dictionary))
+        else:
+            bows = [dictionary.doc2bow(tl) for tl in self.texts]
         self.bows = bows
 
         if bad_tokens:
@@ -65,42 +168,82 @@ class TopicModel():
             )
         self.bows = bows
         self.dictionary = dictionary
+        self.scorer = None
+
+    def fit_model(self, num_topics, model="ldamulticore", sample=None, **kwargs):
+        """
+        fit model on the corpus of build_corpus
+        sample (array of int|None): train on these documents only, see
+        sampling.stratified_sample, get_topic_distribution still covers all
+        """
+        bows = self.bows if sample is None else [self.bows[i] for i in sample]
         if model == "ldamulticore":       
             self.model = models.LdaMulticore(
-                bows, num_topics=num_topics, id2word=dictionary, **kwargs
+                bows, num_topics=num_topics, id2word=self.dictionary, **kwargs
             )
         if model == "lda":
             self.model = models.LdaModel(
-                bows, num_topics=num_topics, id2word=dictionary, **kwargs
+                bows, num_topics=num_topics, id2word=self.dictionary, **kwargs
             )
 
-    def tune_topic_range(self, ntopics=[10,20,30,40,50], plot_topics=False, **kwargs):
-        n_cohers = list()
-        for i, n in enumerate(ntopics):
-            model_path = os.path.join("mdl", f"LDA_{n}_topics")
-            print("[INFO] Estimating coherence model for {} topics, iteration {}".format(n, i))
-            tm = TopicModel(self.tokenlists)
-            tm.fit(n, **kwargs)
-            n_cohers.append(tm.get_coherence())
-            # figure out a clever way to save/load with bow and dictionary
-            #tm.save_model(model_path)
-        
-        n_cohers = np.array(n_cohers, dtype=np.float)
-        idx =  n_cohers.argsort()[-len(ntopics):][::-1]
-        n = ntopics[idx[np.argmax(n_cohers[idx]) & (np.gradient(n_cohers)[idx] >= 0)][0]]
+    def tune_topic_range(self, ntopics=[10,20,30,40,50], plot_topics=False, cores=None, strategy="grid", search=None, **kwargs):
+        """
+        cores (int|None): total number of cores, split between concurrent fits
+        (over ntopics) and LdaMulticore workers per fit, None for all
+        strategy ('grid'|'golden'|'halving'|'early'): search over ntopics, see KSearch
+        search (dict|None): settings of the search strategy, see KSearch
+        **kwargs: arguments to fit, the corpus is built once and shared by all fits
+
+        returns the selected number of topics and the coherence of every entry of
+        ntopics (nan if not fit on the full corpus), the search is kept as self.ksearch
+        """
+        corpus_kwargs = {key: kwargs.pop(key) for key in CORPUS_ARGS if key in kwargs}
+        self.build_corpus(**corpus_kwargs)
+
+        model = kwargs.pop("model", "ldamulticore")
+        outer, inner = split_cores(cores, len(ntopics), inner=kwargs.get("workers"))
+        if model == "ldamulticore":
+            kwargs["workers"] = inner
+        print("[INFO] Estimating coherence models for {} topics ({} search), {} at a time".format(ntopics, strategy, outer))
+        initargs = (self.texts, self.dictionary, self.bows, model, kwargs)
+        pool = ProcessPoolExecutor(outer, initializer=_init_grid, initargs=initargs) if outer > 1 else None
+        # single fits run in this process
+        _init_grid(*initargs)
+        try:
+            self.ksearch = KSearch(ntopics, evaluator(_fit_topics, self.coherence_scorer(), pool), strategy=strategy, batch=outer, **(search or dict()))
+            n = self.ksearch.run()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        report = self.ksearch.report()
+        print("[INFO] {} models fit ({} on the full corpus), {} full fits saved against the grid of {}".format(
+            report["fits"], report["full_corpus_fits"], report["saved"], report["grid_fits"]))
+
+        n_cohers = self.ksearch.cohers()
         if plot_topics:
-            plt.plot(ntopics, n_cohers)
+            fitted = np.isfinite(n_cohers)
+            plt.plot(np.array(ntopics)[fitted], n_cohers[fitted], marker="o")
             plt.xlabel("Number of topics")
             plt.ylabel("Coherence")
             plt.savefig("topics.png")
             plt.close()
         return n, n_cohers
 
+    def coherence_scorer(self, coherence="c_v", **kwargs):
+        """ scorer over the corpus of build_corpus, its co-occurrence counts are
+        shared by all models scored with the same settings
+        """
+        settings = dict(coherence=coherence, **kwargs)
+        if self.scorer is None or self.scorer_settings != settings:
+            self.scorer = SharedCoherence(self.texts, self.dictionary, **settings)
+            self.scorer_settings = settings
+        return self.scorer
+
     def get_coherence(self, **kwargs):
-            coherence_model_lda = CoherenceModel(
-                model=self.model, texts=self.tokenlists, corpus=self.bows, **kwargs
-            )
-            return coherence_model_lda.get_coherence()
+        """
+        **kwargs: coherence settings, see SharedCoherence
+        """
+        return self.coherence_scorer(**kwargs).score_model(self.model)
 
     def get_log_complexity(self):
         return self.model.log_perplexity(self.bows)
@@ -119,11 +262,9 @@ class TopicModel():
             for topic in self.model.show_topics(num_topics=-1, num_words=10):
                 f.write("{}\n\n".format(topic))
 
-    def get_topic_distribution(self):
-        theta = list()
-        for bow in self.bows:
-            thetas = [x[1] for x in 
-                      self.model.get_document_topics(bow, 
-                        minimum_probability=0.0)]
-            theta.append(thetas)
-        return theta
+    def get_topic_distribution(self, **kwargs):
+        """
+        **kwargs: see tekisuto.models.inference.infer_theta (workers, chunksize, path)
+        returns a float32 array of shape (n_docs, num_topics)
+        """
+        return infer_theta(self.model, self.bows, **kwargs)
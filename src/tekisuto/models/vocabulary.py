@@ -0,0 +1,126 @@
+"""
+Bounded-memory vocabulary selection for very large, noisy (e.g. OCR) corpora
+"""
+import zlib
+from operator import itemgetter
+
+import numpy as np
+from gensim import corpora
+
+# rough memory of one monitored word in SpaceSaving (python dict entry)
+BYTES_PER_WORD = 160
+# default number of ids of a hashed vocabulary, every topic-word matrix has k times as many entries
+ID_RANGE = 2 ** 18
+
+
+class CountMinSketch:
+    def __init__(self, width, depth=4):
+        """ approximate counts in a fixed (depth, width) table, estimates never undercount
+            - width: int, counters per row, the overcount shrinks with width
+            - depth: int, number of hash rows
+        """
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.seeds = [(0x9E3779B1 * (i + 1)) & 0xFFFFFFFF for i in range(depth)]
+
+    @classmethod
+    def from_memory(cls, nbytes, depth=4):
+        return cls(max(1, nbytes // (4 * depth)), depth=depth)
+
+    def _columns(self, tokens):
+        encoded = [token.encode("utf-8") for token in tokens]
+        return np.array([[zlib.crc32(b, seed) % self.width for b in encoded] for seed in self.seeds], dtype=np.int64)
+
+    def add(self, tokens):
+        """ count every token once (pass unique tokens for document frequencies)
+        """
+        if not tokens:
+            return
+        columns = self._columns(tokens)
+        np.add.at(self.table, (np.arange(self.depth)[:, None], columns), 1)
+
+    def estimate(self, tokens):
+        if not tokens:
+            return np.zeros(0, dtype=np.int64)
+        return self.table[np.arange(self.depth)[:, None], self._columns(tokens)].min(axis=0).astype(np.int64)
+
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        """ the most frequent words in at most capacity counters, counts never undercount
+            - capacity: int, number of monitored words
+
+        When the table is full, the least frequent tenth is dropped at once and new words start
+        above the largest dropped count, so every word more frequent than that stays monitored.
+        """
+        self.capacity = capacity
+        self.counts = dict()
+        self.floor = 0
+
+    def add(self, tokens):
+        for token in tokens:
+            count = self.counts.get(token)
+            if count is None:
+                if len(self.counts) >= self.capacity:
+                    self._evict()
+                self.counts[token] = self.floor + 1
+            else:
+                self.counts[token] = count + 1
+
+    def _evict(self):
+        ranked = sorted(self.counts.items(), key=itemgetter(1))
+        drop = ranked[:max(1, len(ranked) // 10)]
+        self.floor = max(self.floor, drop[-1][1])
+        for token, _ in drop:
+            del self.counts[token]
+
+
+def sketch_vocabulary(texts, memory=2 ** 30, no_below=1, depth=4):
+    """ words that may have a document frequency of at least no_below, from one pass with
+        a count-min sketch and a SpaceSaving table that share a budget of memory bytes
+
+        Every word with a document frequency above the floor of the table is found. If the table
+        overflowed so far that its floor reached no_below, words with a document frequency between
+        no_below and the floor can be missing, which is reported with a warning.
+    """
+    sketch = CountMinSketch.from_memory(memory // 2, depth=depth)
+    monitored = SpaceSaving(max(1, (memory // 2) // BYTES_PER_WORD))
+    for tokens in texts:
+        unique = list(set(tokens))
+        sketch.add(unique)
+        monitored.add(unique)
+    if monitored.floor >= no_below:
+        print("[INFO] warning: sketch vocabulary evicted words with document frequency up to {} (no_below {}), "
+              "words between the two can be missing, increase memory".format(monitored.floor, no_below))
+    kept = set()
+    candidates = list(monitored.counts.items())
+    for start in range(0, len(candidates), 10000):
+        batch = candidates[start:start + 10000]
+        dfs = np.minimum(sketch.estimate([token for token, _ in batch]), [count for _, count in batch])
+        kept.update(token for (token, _), df in zip(batch, dfs.tolist()) if df >= no_below)
+    return kept
+
+
+def bounded_dictionary(texts, memory=2 ** 30, no_below=1, depth=4):
+    """ gensim Dictionary whose exact counts are only kept for the words selected by
+        sketch_vocabulary, texts are read twice
+        - memory: int, bytes for the approximate pre-pass, also bounds the exact dictionary
+        - no_below: int, minimum document frequency, words below it are never counted exactly
+
+        Counts of kept words and num_docs are exact, so filter_extremes can follow as usual.
+    """
+    kept = sketch_vocabulary(texts, memory=memory, no_below=no_below, depth=depth)
+    dictionary = corpora.Dictionary()
+    for tokens in texts:
+        dictionary.doc2bow([token for token in tokens if token in kept], allow_update=True)
+    return dictionary
+
+
+def hash_dictionary(texts, id_range=ID_RANGE, debug=False):
+    """ HashDictionary with id_range ids, words are not stored (topics show word ids) unless
+        debug is set, which costs memory for every word
+        - id_range: int, number of ids, sets the size of the topic-word matrices (k x id_range)
+          rather than the memory of the dictionary, which holds no words
+    """
+    return corpora.HashDictionary(texts, id_range=id_range, debug=debug)
@@ -2,4 +2,6 @@ from .casefolder import CaseFolder
 from .lemmatizer import Lemmatizer, LemmatizerSpacy
 from .regxfilter import RegxFilter
 from .tokenizer import Tokenizer
-from .swfilter import StopWordFilter
\ No newline at end of file
+from .swfilter import StopWordFilter
+from .pipeline import CompiledPipeline
+from .lemmamemo import LemmaMemo
\ No newline at end of file
@@ -4,6 +4,9 @@ Simple preprocesser for casefolding
 class CaseFolder:
     def __init__(self, lower=True):
         self.lower = lower
+
+    def fingerprint(self):
+        return "CaseFolder(lower={})".format(self.lower)
     
     def preprocess(self, text):
         if self.lower:
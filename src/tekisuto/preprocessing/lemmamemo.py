@@ -0,0 +1,178 @@
+"""
+Bounded word form to lemma memo table for fast lemmatization
+"""
+import json
+from collections import OrderedDict
+
+
+class LemmaMemo:
+    def __init__(self, maxsize=1000000, min_count=2, ambiguity=0.05, max_unknown=0.1):
+        """
+        - maxsize: int, maximum number of word forms, least recently used forms are evicted first
+        - min_count: int, times a form must have been lemmatized by the full model before it is trusted
+        - ambiguity: float, a form is ambiguous if its second most frequent lemma has at least this share
+        - max_unknown: float, documents with a larger share of unknown forms go through the full model
+
+        Known forms are looked up, unknown forms of mostly known documents are lemmatized in isolation,
+        and documents with ambiguous or many unknown forms are lemmatized in context by the full model,
+        which also feeds the table.
+        """
+        self.maxsize = maxsize
+        self.min_count = min_count
+        self.ambiguity = ambiguity
+        self.max_unknown = max_unknown
+        self.table = OrderedDict()
+        self.isolated = OrderedDict()
+        self.resolved = 0
+        self.total = 0
+        # changes since the last drain(), only recorded in preprocessing worker processes
+        self.tracking = False
+        self.delta = {"table": dict(), "isolated": dict()}
+        self.drained = (0, 0)
+
+    def learn(self, pairs):
+        """ add (form, lemma) pairs observed in a fully lemmatized document
+        """
+        for form, lemma in pairs:
+            if lemma is None:
+                continue
+            counts = self.table.pop(form, None)
+            if counts is None:
+                counts = dict()
+            counts[lemma] = counts.get(lemma, 0) + 1
+            self.table[form] = counts
+            if self.tracking:
+                counts = self.delta["table"].setdefault(form, dict())
+                counts[lemma] = counts.get(lemma, 0) + 1
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+    def drain(self):
+        """ return and reset what a worker process learned since the last drain, see merge
+        """
+        delta = dict(self.delta, resolved=self.resolved - self.drained[0], total=self.total - self.drained[1])
+        self.delta = {"table": dict(), "isolated": dict()}
+        self.drained = (self.resolved, self.total)
+        return delta
+
+    def merge(self, delta):
+        """ add the table counts, isolated lemmas and hit counts of a drained worker memo
+        """
+        for form, learned in delta["table"].items():
+            counts = self.table.pop(form, None)
+            if counts is None:
+                counts = dict()
+            for lemma, count in learned.items():
+                counts[lemma] = counts.get(lemma, 0) + count
+            self.table[form] = counts
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+        self.isolated.update(delta["isolated"])
+        while len(self.isolated) > self.maxsize:
+            self.isolated.popitem(last=False)
+        self.resolved += delta["resolved"]
+        self.total += delta["total"]
+
+    def lookup(self, form):
+        """ return the lemma of form, None if unknown and False if ambiguous
+        """
+        counts = self.table.get(form)
+        if counts is None:
+            return None
+        self.table.move_to_end(form)
+        ranked = sorted(counts.values(), reverse=True)
+        total = sum(ranked)
+        if total < self.min_count:
+            return None
+        if len(ranked) > 1 and ranked[1] / total >= self.ambiguity:
+            return False
+        return max(counts, key=counts.get)
+
+    def lemmatize(self, texts, pairs_batch):
+        """ lemmatize a list of whitespace tokenized texts
+            - pairs_batch: callable, full model returning a list of (form, lemma) pairs per text,
+              None for a text it failed on, which keeps its word forms and is not memoized
+        """
+        out = [None] * len(texts)
+        full = list()
+        partial = list()
+        for i, text in enumerate(texts):
+            forms = text.split()
+            lemmas = [self.lookup(form) for form in forms]
+            self.total += len(forms)
+            if False in lemmas or sum(1 for lemma in lemmas if lemma is None) > self.max_unknown * len(forms):
+                full.append(i)
+            elif None in lemmas:
+                partial.append((i, forms, lemmas))
+            else:
+                self.resolved += len(forms)
+                out[i] = " ".join(lemmas)
+
+        if full:
+            for i, pairs in zip(full, pairs_batch([texts[i] for i in full])):
+                if pairs is None:
+                    out[i] = " ".join(texts[i].split())
+                    continue
+                self.learn(pairs)
+                out[i] = " ".join([lemma for _, lemma in pairs if lemma is not None])
+
+        if partial:
+            unknown = sorted({form for _, forms, lemmas in partial for form, lemma in zip(forms, lemmas) if lemma is None and form not in self.isolated})
+            for form, pairs in zip(unknown, pairs_batch(unknown)):
+                if pairs is None:
+                    continue
+                self.isolated[form] = " ".join([lemma for _, lemma in pairs if lemma is not None])
+                if self.tracking:
+                    self.delta["isolated"][form] = self.isolated[form]
+            for i, forms, lemmas in partial:
+                resolved = list()
+                for form, lemma in zip(forms, lemmas):
+                    if lemma is None and form in self.isolated:
+                        lemma = self.isolated[form]
+                        self.isolated.move_to_end(form)
+                    elif lemma is None:
+                        # the model failed on the form, keep it as is
+                        lemma = form
+                    else:
+                        self.resolved += 1
+                    resolved.append(lemma)
+                out[i] = " ".join([lemma for lemma in resolved if lemma])
+            while len(self.isolated) > self.maxsize:
+                self.isolated.popitem(last=False)
+
+        return out
+
+    def hitrate(self):
+        """ share of word forms resolved from the memo table (rather than a model)
+        """
+        return self.resolved / self.total if self.total else 0.
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"table": list(self.table.items()), "isolated": list(self.isolated.items())}, f)
+
+    def load(self, path):
+        """ preload the table from a previous run or corpus
+        """
+        with open(path, "r") as f:
+            obj = json.load(f)
+        for form, counts in obj["table"]:
+            self.table[form] = counts
+        for form, lemma in obj["isolated"]:
+            self.isolated[form] = lemma
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+        return self
+
+
+def agreement(texts, fast, full):
+    """ token level agreement between fast (memo) and full lemmatization of texts
+        - fast, full: callables returning a list of lemmatized texts
+    """
+    agree = 0
+    total = 0
+    for a, b in zip(fast(texts), full(texts)):
+        a, b = a.split(), b.split()
+        agree += sum(1 for x, y in zip(a, b) if x == y)
+        total += max(len(a), len(b))
+    return agree / total if total else 1.
@@ -2,14 +2,70 @@
 Simple preprocesser for lemmatization with Stanza
 """
 import stanza
+import spacy
 
 lang_dict={"da": "da_core_news_lg", "en": "en_core_web_lg"}
+# spaCy components that do not contribute to lemmas
+unused_pipes = ("parser", "ner", "textcat", "textcat_multilabel", "entity_linker", "entity_ruler")
 
 class Lemmatizer:
-    def __init__(self, lang="en"):
+    def __init__(self, lang="en", batch_size=32, memo=None):
+        """
+        - batch_size: int, number of documents per Stanza bulk_process call in preprocess_batch
+        - memo: LemmaMemo, fast mode, known word forms are looked up instead of lemmatized
+        """
+        self.lang = lang
+        self.batch_size = batch_size
+        self.memo = memo
         self.nlp = stanza.Pipeline(lang=lang, processors='tokenize,pos,lemma')
+
+    def __getstate__(self):
+        # stanza pipelines do not pickle, worker processes rebuild them from the language
+        state = self.__dict__.copy()
+        del state["nlp"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.nlp = stanza.Pipeline(lang=self.lang, processors='tokenize,pos,lemma')
+
+    def fingerprint(self):
+        return "Lemmatizer(stanza={}, lang={}, memo={})".format(stanza.__version__, self.lang, self.memo is not None)
+    
+    def _lemmas(self, doc):
+        return " ".join([word.lemma for sent in doc.sentences for word in sent.words if word.lemma is not None])
+
+    def _pairs(self, doc):
+        return [(word.text, word.lemma) for sent in doc.sentences for word in sent.words]
+
+    def _pairs_single(self, text):
+        try:
+            return self._pairs(self.nlp(text))
+        except Exception:
+            return None
+
+    def pairs_batch(self, texts):
+        """ full model (form, lemma) pairs for each text, None for a text the model fails on,
+            a failing batch is retried one text at a time
+        """
+        out = list()
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            docs = None
+            if hasattr(self.nlp, "bulk_process"):
+                try:
+                    docs = self.nlp.bulk_process([stanza.Document([], text=text) for text in batch])
+                except Exception:
+                    docs = None
+            if docs is None:
+                out.extend([self._pairs_single(text) for text in batch])
+            else:
+                out.extend([self._pairs(doc) for doc in docs])
+        return out
     
     def preprocess(self, text):
+        if self.memo is not None:
+            return self.preprocess_batch([text])[0]
         try:
             doc = self.nlp(text)
             lemma = [word.lemma for sent in doc.sentences for word in sent.words if word.lemma is not None]
@@ -18,15 +74,78 @@ class Lemmatizer:
 
         return " ".join(lemma)
 
+    def preprocess_batch(self, texts):
+        """ lemmatize a list of texts with Stanza's multi-document batching (stanza>=1.2),
+            older versions and failing batches fall back to one document at a time
+        """
+        if self.memo is not None:
+            return self.memo.lemmatize(texts, self.pairs_batch)
+        if not hasattr(self.nlp, "bulk_process"):
+            return [self.preprocess(text) for text in texts]
+        out = list()
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            try:
+                docs = self.nlp.bulk_process([stanza.Document([], text=text) for text in batch])
+                out.extend([self._lemmas(doc) for doc in docs])
+            except:
+                out.extend([self.preprocess(text) for text in batch])
+        return out
+
 class LemmatizerSpacy:
-    def __init__(self, lang="en", nlp=None):
+    def __init__(self, lang="en", nlp=None, batch_size=256, n_process=1, memo=None):
+        """
+        - nlp: loaded spaCy pipeline, components in unused_pipes are disabled while lemmatizing
+        - batch_size: int, nlp.pipe batch size in preprocess_batch
+        - n_process: int, nlp.pipe processes in preprocess_batch
+        - memo: LemmaMemo, fast mode, known word forms are looked up instead of lemmatized
+        """
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.memo = memo
         if nlp is None:
-            model = lang_dict[lang]
-            self.nlp = spacy.load(model)
+            self.model = lang_dict[lang]
+            self.nlp = spacy.load(self.model, disable=list(unused_pipes))
         else:
-            self.nlp = nlp 
+            self.model = "{}_{}".format(nlp.meta["lang"], nlp.meta["name"])
+            self.nlp = nlp
+
+    def _unused(self):
+        return [name for name in self.nlp.pipe_names if name in unused_pipes]
+
+    def __getstate__(self):
+        # reload the installed model in worker processes instead of pickling it
+        state = self.__dict__.copy()
+        del state["nlp"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.nlp = spacy.load(self.model, disable=list(unused_pipes))
+
+    def fingerprint(self):
+        return "LemmatizerSpacy(spacy={}, model={}, version={}, memo={})".format(spacy.__version__, self.model, self.nlp.meta["version"], self.memo is not None)
+
+    def pairs_batch(self, texts):
+        """ full model (form, lemma) pairs for each text
+        """
+        with self.nlp.select_pipes(disable=self._unused()):
+            docs = self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+            return [[(t.text, t.lemma_) for t in doc] for doc in docs]
     
     def preprocess(self, text):
-        doc = self.nlp(text)
+        if self.memo is not None:
+            return self.preprocess_batch([text])[0]
+        with self.nlp.select_pipes(disable=self._unused()):
+            doc = self.nlp(text)
         lemma = [t.lemma_ for t in doc]
         return " ".join(lemma)
+
+    def preprocess_batch(self, texts):
+        """ lemmatize a list of texts with nlp.pipe
+        """
+        if self.memo is not None:
+            return self.memo.lemmatize(texts, self.pairs_batch)
+        with self.nlp.select_pipes(disable=self._unused()):
+            docs = self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+            return [" ".join([t.lemma_ for t in doc]) for doc in docs]
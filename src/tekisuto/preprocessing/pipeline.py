@@ -0,0 +1,148 @@
+"""
+Compiled preprocessing pipeline, fuses a preprocessor chain into passes over one token list
+"""
+import re
+
+from gensim.utils import deaccent
+
+from .casefolder import CaseFolder
+from .regxfilter import RegxFilter
+from .swfilter import StopWordFilter
+
+# single character-class runs, substituted with a space, one pass over their alternation removes the same
+# characters as one pass per pattern, only the runs of spaces left behind can differ (e.g. [\d+, \W+] on
+# "a 1 b"), so the tokens are the same but the text is not
+CHARCLASS = re.compile(r"^(\\[wWdDsS]|\[[^\]]+\])\+?$")
+NONWORD = (r"\W", r"\W+")
+# gensim's PAT_ALPHABETIC, (?!\d)\w is the character class [^\W\d]
+ALPHABETIC = re.compile(r"[^\W\d]+")
+
+
+class CompiledPipeline:
+    def __init__(self, preprocessors, tokenizer=None):
+        """
+        - preprocessors: list of preprocessors as passed to the dataset loaders
+        - tokenizer: Tokenizer, optional final tokenization (output is then a list of tokens)
+
+        Produces the same tokens as running the preprocessors one after the other (followed by
+        Tokenizer.doctokenizer), but resources are loaded once and the text is tokenized once:
+            - consecutive RegxFilters on character classes (e.g. \\W+, \\d+) run as one regex pass,
+              which can leave other runs of whitespace than separate passes, so without a tokenizer
+              the output text equals the sequential one only up to whitespace
+            - StopWordFilter, CaseFolder and Tokenizer are passes over the token list
+            - other preprocessors (e.g. lemmatizers) get the joined text
+        """
+        self.preprocessors = list(preprocessors)
+        self.tokenizer = tokenizer
+        self.stages = self._compile(self.preprocessors)
+
+    @staticmethod
+    def _compile(preprocessors):
+        stages = list()
+        run = list()
+
+        def close_run():
+            if not run:
+                return
+            patterns = [p.pattern.pattern for p in run]
+            if len(run) > 1 and all(CHARCLASS.match(pattern) for pattern in patterns):
+                fused = re.compile("|".join(patterns), flags=re.MULTILINE)
+                stages.append(("regex", [fused], any(pattern in NONWORD for pattern in patterns)))
+            else:
+                stages.append(("regex", [p.pattern for p in run], any(pattern in NONWORD for pattern in patterns)))
+            del run[:]
+
+        for p in preprocessors:
+            if isinstance(p, RegxFilter):
+                run.append(p)
+                continue
+            close_run()
+            if isinstance(p, StopWordFilter):
+                stages.append(("stopwords", p))
+            elif isinstance(p, CaseFolder):
+                stages.append(("case", p.lower))
+            else:
+                stages.append(("text", p))
+        close_run()
+        return stages
+
+    def fingerprint(self):
+        parts = [p.fingerprint() for p in self.preprocessors]
+        if self.tokenizer is not None:
+            parts.append("Tokenizer(deacc={})".format(self.tokenizer.deacc))
+        return "CompiledPipeline({})".format(", ".join(parts))
+
+    def _apply(self, stage, state):
+        """ apply one stage to a (text, tokens, wordonly) state, exactly one of text and tokens is set
+            - wordonly: True while the text is known to hold only word characters and whitespace,
+              for such text str.split() gives the same tokens as the Punkt word tokenizer
+        """
+        text, tokens, wordonly = state
+        kind = stage[0]
+        if kind == "regex":
+            if tokens is not None:
+                text, tokens = " ".join(tokens), None
+            for pattern in stage[1]:
+                text = pattern.sub(" ", text)
+            wordonly = wordonly or stage[2]
+        elif kind == "stopwords":
+            sw = stage[1].stopword_set
+            if stage[1].token:
+                unigrams = tokens if tokens is not None else text
+            elif tokens is not None:
+                unigrams = [t.lower() for t in tokens] if wordonly else stage[1].tokenize(" ".join(tokens))
+            else:
+                unigrams = text.lower().split() if wordonly else stage[1].tokenize(text)
+            text, tokens = None, [unigram for unigram in unigrams if not unigram in sw]
+        elif kind == "case":
+            if tokens is not None:
+                tokens = [t.lower() if stage[1] else t.upper() for t in tokens]
+            else:
+                text = text.lower() if stage[1] else text.upper()
+        else:
+            if tokens is not None:
+                text, tokens = " ".join(tokens), None
+            text = stage[1].preprocess(text)
+            wordonly = False
+        return text, tokens, wordonly
+
+    def _finish(self, state):
+        text, tokens, _ = state
+        if self.tokenizer is None:
+            return " ".join(tokens) if tokens is not None else text
+
+        # gensim's simple_preprocess as a single regex pass
+        if tokens is not None:
+            text = " ".join(tokens)
+        text = text.lower()
+        if self.tokenizer.deacc:
+            text = deaccent(text)
+        return [token for token in ALPHABETIC.findall(text) if 2 <= len(token) <= 15 and token[0] != "_"]
+
+    def preprocess(self, text):
+        """ run text through all stages, returns str or (with a tokenizer) list of tokens
+        """
+        state = (text, None, False)
+        for stage in self.stages:
+            state = self._apply(stage, state)
+        return self._finish(state)
+
+    def preprocess_batch(self, texts):
+        """ run a list of texts through all stages, stage by stage, so preprocessors with
+            preprocess_batch (e.g. lemmatizers) get the whole batch at once
+        """
+        states = [(text, None, False) for text in texts]
+        for stage in self.stages:
+            if stage[0] == "text" and hasattr(stage[1], "preprocess_batch"):
+                joined = [text if tokens is None else " ".join(tokens) for text, tokens, _ in states]
+                states = [(text, None, False) for text in stage[1].preprocess_batch(joined)]
+            else:
+                states = [self._apply(stage, state) for state in states]
+        return [self._finish(state) for state in states]
+
+    def doctokenizer(self, docs):
+        """ preprocess list of strings and return list of list of unigrams
+        """
+        assert type(docs) == list, "Input has to be list"
+
+        return self.preprocess_batch(docs)
@@ -6,6 +6,9 @@ import re
 class RegxFilter:
     def __init__(self, pattern):
         self.pattern = re.compile(r"{}".format(pattern),flags=re.MULTILINE)
+
+    def fingerprint(self):
+        return "RegxFilter(pattern={!r})".format(self.pattern.pattern)
     
     def preprocess(self, text):
         return self.pattern.sub(" ", text)
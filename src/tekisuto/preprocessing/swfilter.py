@@ -5,6 +5,8 @@ path: path to custom list
 token: if text is tokenized
 language: filter lanugage is path is False
 """
+import hashlib
+
 from nltk.corpus import stopwords
 from nltk.tokenize.punkt import PunktLanguageVars
 
@@ -13,19 +15,41 @@ class StopWordFilter:
         self.path = path
         self.token = token
         self.lang = language
-    
-    def preprocess(self, text):
+        self._stopwords = None
+        self._plv = PunktLanguageVars()
+
+    @property
+    def stopword_set(self):
+        """ stopword set, read once on first use
+        """
+        if self._stopwords is None:
+            if self.path:
+                with open(self.path, "r") as f:
+                    self._stopwords = set(f.read().split("\n")[:-1])
+            else:
+                self._stopwords = set(stopwords.words(self.lang))
+        return self._stopwords
+
+    def tokenize(self, text):
+        return self._plv.word_tokenize(text.lower())
+
+    def fingerprint(self):
+        """ identifies the stopword list by content, not by path
+        """
         if self.path:
-            with open(self.path, "r") as f:
-                sw = set(f.read().split("\n")[:-1])
+            with open(self.path, "rb") as f:
+                source = hashlib.sha1(f.read()).hexdigest()
         else:
-            sw = set(stopwords.words(self.lang))
+            source = "nltk:{}".format(self.lang)
+        return "StopWordFilter(stopwords={}, token={})".format(source, self.token)
+    
+    def preprocess(self, text):
+        sw = self.stopword_set
         
         if self.token:
             unigrams = text
         else:
-            plv = PunktLanguageVars()
-            unigrams = plv.word_tokenize(text.lower())
+            unigrams = self.tokenize(text)
         
         return " ".join([unigram for unigram in unigrams if not unigram in sw])
 
@@ -3,6 +3,8 @@ Simple preprocessor for tokenization with Gensim
 """
 from gensim.utils import simple_preprocess
 
+from tekisuto.datasets.tokencorpus import TokenCorpus
+
 
 class Tokenizer:
     def __init__(self, deacc=False):
@@ -24,3 +26,11 @@ class Tokenizer:
         assert type(docs) == list, "Input has to be list"
 
         return list(self.sentokenizer(docs))
+
+    def doccorpus(self, docs):
+        """ Tokenize list of strings into a compact TokenCorpus (int32 token ids and document offsets)
+        - deacc: default False with punctuation, True without
+        """
+        assert type(docs) == list, "Input has to be list"
+
+        return TokenCorpus.from_texts(self.sentokenizer(docs))
@@ -1,4 +1,7 @@
 import os
+from datetime import datetime, timezone
+
+import numpy as np
 
 def listFiles(dirName):
     """
@@ -15,4 +18,129 @@ def listFiles(dirName):
         else:
             allFiles.append(fullPath)
                 
-    return allFiles
\ No newline at end of file
+    return allFiles
+
+def split_cores(cores, ntasks, inner=None):
+    """
+    split a budget of cores between parallel tasks (outer) and workers per task (inner)
+    Parameters:
+        cores: int total number of cores, None for all
+        ntasks: int number of tasks
+        inner: int workers per task, None to derive from the budget, capped at cores
+
+    returns (outer, inner) with outer * inner <= cores
+    """
+    if cores is None:
+        cores = os.cpu_count() or 1
+    cores = max(1, cores)
+    if inner is None:
+        outer = max(1, min(ntasks, cores))
+        inner = max(1, cores // outer)
+    else:
+        inner = max(1, min(inner, cores))
+        outer = max(1, min(ntasks, cores // inner))
+    return outer, inner
+
+
+# utc offset of dates without a time zone
+NAIVE = np.iinfo(np.int32).min
+
+def dates_to_epoch(dates, offsets=False):
+    """
+    convert ISO 8601 date strings to an int64 array of seconds since the epoch
+    Parameters:
+        dates: list of str, dates without a time zone are taken as UTC
+        offsets: bool, also return the utc offset of every date in seconds as an int32 array
+                 (NAIVE for dates without a time zone), see epoch_to_dates
+    """
+    epoch = list()
+    offset = list()
+    for date in dates:
+        date = datetime.fromisoformat(date.replace("Z", "+00:00"))
+        if date.tzinfo is None:
+            offset.append(NAIVE)
+            date = date.replace(tzinfo=timezone.utc)
+        else:
+            offset.append(int(date.utcoffset().total_seconds()))
+        epoch.append(int(date.timestamp()))
+    if offsets:
+        return np.array(epoch, dtype=np.int64), np.array(offset, dtype=np.int32)
+    return np.array(epoch, dtype=np.int64)
+
+def local_epoch(epoch, offsets=None):
+    """
+    seconds since the epoch shifted to local time, so days start at local midnight
+    Parameters:
+        epoch: array of int
+        offsets: array of int or int, utc offsets in seconds as returned by dates_to_epoch, None for UTC
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    if offsets is None:
+        return epoch
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return epoch + np.where(offsets == NAIVE, 0, offsets)
+
+def epoch_to_dates(epoch, offsets=None):
+    """
+    convert seconds since the epoch to ISO 8601 date strings
+    Parameters:
+        epoch: array of int
+        offsets: array of int or int, utc offset of every date as returned by dates_to_epoch,
+                 None for UTC ("...Z"), NAIVE dates are written without a time zone
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    if offsets is None:
+        return np.datetime_as_string(epoch.astype("datetime64[s]"), unit="s", timezone="UTC").tolist()
+    offsets = np.broadcast_to(np.asarray(offsets, dtype=np.int64), epoch.shape)
+    local = np.datetime_as_string(local_epoch(epoch, offsets).astype("datetime64[s]"), unit="s")
+    suffix = np.empty(epoch.shape, dtype=object)
+    for offset in np.unique(offsets):
+        if offset == NAIVE:
+            zone = ""
+        else:
+            zone = "{}{:02d}:{:02d}".format("-" if offset < 0 else "+", abs(int(offset)) // 3600, abs(int(offset)) % 3600 // 60)
+        suffix[offsets == offset] = zone
+    return [date + zone for date, zone in zip(local.tolist(), suffix.tolist())]
+
+BUCKETS = ("day", "week", "month", "year")
+
+def date_buckets(dates, bucket="month", offsets=None):
+    """
+    integer calendar bucket of every date, consecutive buckets have consecutive integers,
+    buckets follow the local calendar of the dates (a day starts at local midnight)
+    Parameters:
+        dates: int64 epoch seconds or ISO 8601 strings (their utc offsets are read from the strings)
+        bucket: str day, week (starting Monday), month or year
+        offsets: array of int, utc offsets of int64 dates as returned by dates_to_epoch, None for UTC
+    """
+    dates = np.asarray(dates)
+    if dates.dtype.kind in "US":
+        dates, offsets = dates_to_epoch(dates.tolist(), offsets=True)
+    days = local_epoch(dates, offsets) // 86400
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    if bucket in ("month", "year"):
+        return days.astype("datetime64[D]").astype("datetime64[{}]".format(bucket[0].upper())).astype(np.int64)
+    raise ValueError("unknown bucket {}, expected one of {}".format(bucket, BUCKETS))
+
+def bucket_start(buckets, bucket="month"):
+    """
+    seconds since the epoch of the first day of every bucket of date_buckets, local midnight
+    (write with epoch_to_dates(..., NAIVE) if the buckets used utc offsets)
+    Parameters:
+        buckets: array of int
+        bucket: str day, week, month or year
+    """
+    buckets = np.asarray(buckets, dtype=np.int64)
+    if bucket == "day":
+        days = buckets
+    elif bucket == "week":
+        days = buckets * 7 - 3
+    elif bucket in ("month", "year"):
+        days = buckets.astype("datetime64[{}]".format(bucket[0].upper())).astype("datetime64[D]").astype(np.int64)
+    else:
+        raise ValueError("unknown bucket {}, expected one of {}".format(bucket, BUCKETS))
+    return days * 86400
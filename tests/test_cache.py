@@ -0,0 +1,40 @@
+"""
+PreprocessingCache with str and token list output
+"""
+import sqlite3
+
+import pytest
+
+from tekisuto.datasets import PreprocessingCache
+from tekisuto.datasets.preprocessingpool import PreprocessingPool
+from tekisuto.preprocessing import CaseFolder, CompiledPipeline, RegxFilter, Tokenizer
+
+TEXTS = ["Der Hund, 2 Katzen", "Ein Vogel und ein Hund", "Der Hund, 2 Katzen", "Æble og  Øl"]
+
+
+@pytest.mark.parametrize("tokenizer", [None, Tokenizer()])
+def test_cached_output(tmp_path, tokenizer):
+    pipeline = CompiledPipeline([RegxFilter(r"\d+"), CaseFolder()], tokenizer=tokenizer)
+    expected = [pipeline.preprocess(text) for text in TEXTS]
+    cache = PreprocessingCache(str(tmp_path / "cache.db"))
+    assert list(PreprocessingPool([pipeline], cache=cache).imap(TEXTS)) == expected
+    cache.close()
+    cache = PreprocessingCache(str(tmp_path / "cache.db"))
+    assert list(PreprocessingPool([pipeline], cache=cache).imap(TEXTS)) == expected
+    assert cache.stats()["hits"] == len(TEXTS) and cache.stats()["misses"] == 0
+
+
+def test_cache_without_encoded_column(tmp_path):
+    # caches written before non-str values keep their str values
+    path = str(tmp_path / "cache.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE docs (key TEXT PRIMARY KEY, value TEXT, size INTEGER, atime REAL)")
+    db.execute("INSERT INTO docs VALUES ('a', '[\"x\"]', 5, 0)")
+    db.commit()
+    db.close()
+    cache = PreprocessingCache(path)
+    cache.put_many([("b", ["x"])])
+    assert cache.get_many(["a", "b"]) == {"a": "[\"x\"]", "b": ["x"]}
+    assert cache.size() == 10
+    with pytest.raises(ValueError):
+        cache.put_many([("c", object())])
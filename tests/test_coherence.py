@@ -0,0 +1,117 @@
+"""
+SharedCoherence and its co-occurrence index against direct window counts and gensim's measures
+"""
+import numpy as np
+import pytest
+from gensim import corpora
+from gensim.models.coherencemodel import CoherenceModel, COHERENCE_MEASURES
+
+from tekisuto.datasets import TokenCorpus
+from tekisuto.models.coherence import CooccurrenceIndex, SharedCoherence, _Counts
+
+
+def corpus(n=60, vocab=30, seed=3):
+    rng = np.random.RandomState(seed)
+    words = ["w{}".format(i) for i in range(vocab)]
+    texts = [[words[j] for j in rng.randint(0, vocab, size=rng.randint(0, 40))] for _ in range(n)]
+    dictionary = corpora.Dictionary(texts)
+    # words outside the dictionary still take up window positions
+    dictionary.filter_tokens(bad_ids=[dictionary.token2id["w0"], dictionary.token2id["w1"]])
+    return texts, dictionary
+
+
+def window_counts(texts, dictionary, ids, window_size):
+    """ (co-)occurrences in every boolean window, one window at a time
+    """
+    counts, num_docs = np.zeros((len(ids), len(ids)), dtype=np.int64), 0
+    for text in texts:
+        text = [dictionary.token2id.get(token, -1) for token in text]
+        if not any(i >= 0 for i in text):
+            continue
+        if window_size is None or len(text) < window_size:
+            windows = [text]
+        else:
+            windows = [text[s:s + window_size] for s in range(len(text) - window_size + 1)]
+        for window in windows:
+            num_docs += 1
+            present = np.isin(ids, window)
+            counts += np.outer(present, present)
+    return counts, num_docs
+
+
+@pytest.mark.parametrize("window_size", [None, 1, 3, 10, 100])
+@pytest.mark.parametrize("chunksize", [3, 2 ** 20])
+def test_index_counts(window_size, chunksize):
+    texts, dictionary = corpus()
+    index = CooccurrenceIndex.build(texts, dictionary)
+    # an id beyond the index never occurs
+    ids = np.array(sorted(dictionary.token2id.values()) + [999])
+    rows = np.arange(0, len(ids), 2)
+    expected, num_docs = window_counts(texts, dictionary, ids, window_size)
+    counts = index.count(ids, rows, window_size=window_size, chunksize=chunksize).toarray()
+    assert np.array_equal(counts, expected[rows])
+    assert index.num_docs(window_size) == num_docs
+
+
+def test_token_corpus_and_disk(tmp_path):
+    texts, dictionary = corpus()
+    ids = np.array(sorted(dictionary.token2id.values()))
+    expected = CooccurrenceIndex.build(texts, dictionary).count(ids, np.arange(len(ids)), 5).toarray()
+    for index in (CooccurrenceIndex.build(TokenCorpus.from_texts(texts), dictionary),
+                  CooccurrenceIndex.build(texts, dictionary, path=str(tmp_path / "index"))):
+        assert np.array_equal(index.count(ids, np.arange(len(ids)), 5).toarray(), expected)
+    assert isinstance(CooccurrenceIndex.load(str(tmp_path / "index")).positions, np.memmap)
+
+
+def topics(dictionary, n=4, topn=8, seed=5):
+    rng = np.random.RandomState(seed)
+    ids = sorted(dictionary.token2id.values())
+    return [rng.choice(ids, topn, replace=False).tolist() for _ in range(n)]
+
+
+@pytest.mark.parametrize("coherence", ["c_v", "c_uci", "c_npmi", "u_mass"])
+def test_incremental_counts(coherence):
+    # words counted model by model give the scores of words counted at once
+    texts, dictionary = corpus()
+    candidates = topics(dictionary)
+    once = SharedCoherence(texts, dictionary, coherence=coherence, topn=8)
+    once.accumulate(candidates)
+    stepwise = SharedCoherence(texts, dictionary, coherence=coherence, topn=8)
+    for topic in candidates:
+        stepwise.score([topic])
+    assert stepwise.covers(candidates)
+    assert np.isclose(stepwise.score(candidates), once.score(candidates))
+    assert np.isclose(stepwise.score(candidates[:2]), once.score(candidates[:2]))
+
+
+def test_c_v_matches_gensim_measure():
+    texts, dictionary = corpus()
+    scorer = SharedCoherence(texts, dictionary, coherence="c_v", topn=8)
+    candidates = [np.array(topic) for topic in topics(dictionary)]
+    score = scorer.score(candidates)
+    words = list(dict.fromkeys(i for topic in candidates for i in topic.tolist()))
+    columns = [scorer.columns[i] for i in words]
+    counts = _Counts(scorer.counts[columns][:, columns].toarray(), {i: j for j, i in enumerate(words)}, scorer.num_docs)
+    measure = COHERENCE_MEASURES["c_v"]
+    expected = measure.aggr(measure.conf(measure.seg(candidates), counts, topics=candidates, measure="nlr", gamma=1))
+    assert np.isclose(score, expected)
+
+
+def test_u_mass_matches_coherence_model():
+    texts, dictionary = corpus()
+    texts = [text for text in texts if any(token in dictionary.token2id for token in text)]
+    candidates = topics(dictionary)
+    expected = CoherenceModel(topics=candidates, texts=texts, dictionary=dictionary, coherence="u_mass", topn=8).get_coherence()
+    assert np.isclose(SharedCoherence(texts, dictionary, coherence="u_mass", topn=8).score(candidates), expected)
+
+
+def test_save_load(tmp_path):
+    texts, dictionary = corpus()
+    candidates = topics(dictionary)
+    scorer = SharedCoherence(texts, dictionary, topn=8)
+    score = scorer.score(candidates[:2])
+    scorer.save(str(tmp_path))
+    loaded = SharedCoherence.load(str(tmp_path))
+    assert np.isclose(loaded.score(candidates[:2]), score)
+    # new words are counted from the loaded index, without texts
+    assert np.isclose(loaded.score(candidates), scorer.score(candidates))
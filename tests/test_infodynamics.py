@@ -0,0 +1,281 @@
+"""
+InfoDynamics and StreamingInfoDynamics against the per-document loop they replaced
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from tekisuto.metrics import kld, jsd
+from tekisuto.models.infodynamics import InfoDynamics, StreamingInfoDynamics, calendar_bins
+from tekisuto.tekiutil import dates_to_epoch, epoch_to_dates, NAIVE
+
+SIGNALS = ("nsignal", "nsigma", "tsignal", "tsigma", "rsignal", "rsigma")
+
+
+def baseline(data, window, weight, meas):
+    """ novelty, transience and resonance as computed one document at a time before lag_bands
+    """
+    m = data.shape[0]
+    N_hat, N_sd = np.zeros(m), np.zeros(m)
+    for i, x in enumerate(data):
+        submat = data[(i - window):i,]
+        tmp = np.zeros(submat.shape[0])
+        if submat.any():
+            for ii, xx in enumerate(submat):
+                tmp[ii] = meas(x, xx)
+        else:
+            tmp = np.zeros([window]) + weight
+        N_hat[i], N_sd[i] = np.mean(tmp), np.std(tmp)
+
+    T_hat, T_sd = np.zeros(m), np.zeros(m)
+    for i, x in enumerate(data):
+        submat = data[i+1:(i + window + 1),]
+        tmp = np.zeros(submat.shape[0])
+        if submat.any():
+            for ii, xx in enumerate(submat):
+                tmp[ii] = meas(x, xx)
+        else:
+            tmp = np.zeros([window])
+        T_hat[i] = np.mean(tmp)
+        T_hat[-window:] = np.zeros([window]) + weight
+        T_sd[i] = np.std(tmp)
+
+    R_hat = N_hat - T_hat
+    R_hat[:window] = weight
+    R_hat[-window:] = weight
+    R_sd = (N_sd + T_sd) / 2
+    R_sd[:window] = weight
+    R_sd[-window:] = weight
+    return dict(nsignal=N_hat, nsigma=N_sd, tsignal=T_hat, tsigma=T_sd, rsignal=R_hat, rsigma=R_sd)
+
+
+def theta(m, k=8, zeros=(), seed=7):
+    rng = np.random.RandomState(seed)
+    data = rng.dirichlet(np.ones(k) * 0.5, m)
+    data[list(zeros)] = 0
+    return data
+
+
+def assert_signals(idmdl, expected, j=None):
+    for name in SIGNALS:
+        actual = getattr(idmdl, name) if j is None else getattr(idmdl, name)[j]
+        assert np.allclose(actual, expected[name], equal_nan=True), name
+
+
+@pytest.mark.parametrize("meas", [kld, jsd])
+@pytest.mark.parametrize("m, window, chunksize", [
+    (40, 3, 10000),
+    (40, 3, 7),
+    (41, 5, 4),
+    (30, 9, 4),
+    (25, 12, 5),
+    (12, 1, 2),
+    ])
+def test_fit_matches_baseline(meas, m, window, chunksize):
+    data = theta(m)
+    idmdl = InfoDynamics(data, None, window=window, chunksize=chunksize).fit(meas)
+    assert_signals(idmdl, baseline(data, window, 0, meas))
+
+
+@pytest.mark.parametrize("meas", [kld, jsd])
+@pytest.mark.parametrize("zeros", [(0,), (4, 5, 6), (10, 11, 12, 13, 14), (29,)])
+def test_zero_rows(meas, zeros):
+    # whole windows of zero rows take the weight (novelty) or 0 (transience)
+    data = theta(30, zeros=zeros)
+    for weight in (0, 1):
+        idmdl = InfoDynamics(data, None, window=3, weight=weight, chunksize=4).fit(meas)
+        assert_signals(idmdl, baseline(data, 3, weight, meas))
+
+
+def test_views_fit_once():
+    data = theta(20)
+    idmdl = InfoDynamics(data, None, window=3)
+    idmdl.resonance(jsd)
+    assert idmdl.meas is jsd
+    assert_signals(idmdl, baseline(data, 3, 0, jsd))
+    idmdl.novelty(kld)
+    assert_signals(idmdl, baseline(data, 3, 0, kld))
+
+
+@pytest.mark.parametrize("meas", [kld, jsd])
+def test_list_of_windows(meas):
+    data = theta(50, zeros=(20, 21, 22))
+    windows = [2, 3, 7, 14]
+    several = InfoDynamics(data, None, window=windows, chunksize=6).fit(meas)
+    assert several.nsignal.shape == (len(windows), 50)
+    for j, window in enumerate(windows):
+        single = InfoDynamics(data, None, window=window, chunksize=6).fit(meas)
+        assert_signals(several, {name: getattr(single, name) for name in SIGNALS}, j)
+
+
+def complete_events(events):
+    complete = sorted((e for e in events if e["complete"]), key=lambda e: e["index"])
+    return {
+        "nsignal": [e["novelty"] for e in complete], "nsigma": [e["nsigma"] for e in complete],
+        "tsignal": [e["transience"] for e in complete], "tsigma": [e["tsigma"] for e in complete],
+        "rsignal": [e["resonance"] for e in complete], "rsigma": [e["rsigma"] for e in complete],
+        }
+
+
+@pytest.mark.parametrize("meas", [kld, jsd])
+@pytest.mark.parametrize("m, window, weight", [(30, 3, 0), (31, 7, 1), (8, 5, 0)])
+def test_streaming_matches_fit(meas, m, window, weight):
+    data = theta(m, zeros=(2, 3, 4))
+    idmdl = InfoDynamics(data, None, window=window, weight=weight).fit(meas)
+    stream = StreamingInfoDynamics(window=window, weight=weight, meas=meas)
+    events = list(stream.process(enumerate(data)))
+    assert sum(e["complete"] for e in events) == m
+    assert_signals(idmdl, complete_events(events))
+    # partial events carry the final novelty already
+    partial = [e["novelty"] for e in events if not e["complete"]]
+    assert np.allclose(partial, idmdl.nsignal, equal_nan=True)
+
+
+def test_streaming_async():
+    data = theta(20)
+
+    async def source():
+        for i, x in enumerate(data):
+            yield i, x
+
+    async def collect():
+        stream = StreamingInfoDynamics(window=3, meas=jsd)
+        return [event async for event in stream.aprocess(source())]
+
+    events = asyncio.run(collect())
+    idmdl = InfoDynamics(data, None, window=3).fit(jsd)
+    assert_signals(idmdl, complete_events(events))
+
+
+def test_calendar_bins_without_tokens():
+    # a bin whose documents all have 0 tokens takes the unweighted mean instead of spreading NaN
+    data = theta(10)
+    time = (np.arange(10) // 2) * 86400
+    lengths = np.ones(10)
+    lengths[4:6] = 0
+    binned, _, counts = calendar_bins(data, time, unit="day", lengths=lengths)
+    assert np.allclose(binned[2], data[4:6].mean(axis=0))
+    idmdl = InfoDynamics(data, time, window=2, unit="day", lengths=lengths).fit(jsd)
+    for name in SIGNALS:
+        assert np.all(np.isfinite(getattr(idmdl, name))), name
+
+
+def test_calendar_bins_empty():
+    binned, starts, counts = calendar_bins(np.zeros((0, 4)), np.zeros(0, dtype=np.int64), unit="day")
+    assert binned.shape == (0, 4) and len(starts) == 0 and len(counts) == 0
+    idmdl = InfoDynamics(np.zeros((0, 4)), np.zeros(0, dtype=np.int64), window=3, unit="day").fit(jsd)
+    assert idmdl.nsignal.shape == (0,)
+
+
+def local_dates(seed=17, n=120, days=24, empty=(5, 6, 13)):
+    """ ISO dates in Copenhagen time around the switch to daylight saving time on 2020-03-29
+        (01:00 UTC, +01:00 to +02:00) in random order, no documents on the days of empty
+    """
+    rng = np.random.RandomState(seed)
+    begin = datetime(2020, 3, 17, tzinfo=timezone.utc)
+    switch = datetime(2020, 3, 29, 1, tzinfo=timezone.utc)
+    dates = list()
+    while len(dates) < n:
+        utc = begin + timedelta(seconds=int(rng.randint(0, days * 86400)))
+        local = utc.astimezone(timezone(timedelta(hours=1 if utc < switch else 2)))
+        if (local.date() - begin.date()).days not in empty:
+            dates.append(local)
+    # documents near local midnight, where UTC and local days differ
+    dates += [datetime(2020, 3, 29, 0, 30, tzinfo=timezone(timedelta(hours=1))),
+              datetime(2020, 3, 30, 0, 30, tzinfo=timezone(timedelta(hours=2)))]
+    return dates
+
+
+def bin_start(date, unit):
+    date = date.date()
+    if unit == "day":
+        return date
+    if unit == "week":
+        return date - timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def next_bin(start, unit):
+    if unit == "day":
+        return start + timedelta(days=1)
+    if unit == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=31)).replace(day=1)
+
+
+def calendar_baseline(data, dates, unit, window, weight, meas, lengths=None):
+    """ bins on the local calendar dates and signals over neighbouring bins with documents, bin by bin
+    """
+    starts = [bin_start(min(dates), unit)]
+    while starts[-1] < bin_start(max(dates), unit):
+        starts.append(next_bin(starts[-1], unit))
+    m = len(starts)
+    members = [[i for i, date in enumerate(dates) if bin_start(date, unit) == start] for start in starts]
+    counts = np.array([len(rows) for rows in members])
+    bins = np.full((m, data.shape[1]), np.nan)
+    for b, rows in enumerate(members):
+        if not rows:
+            continue
+        weights = np.ones(len(rows)) if lengths is None else np.asarray(lengths, dtype=float)[rows]
+        if weights.sum() == 0:
+            weights = np.ones(len(rows))
+        bins[b] = (data[rows] * weights[:, None]).sum(axis=0) / weights.sum()
+
+    signals = {name: np.zeros(m) for name in SIGNALS}
+    for i in range(m):
+        past = [j for j in range(max(0, i - window), i) if counts[j]]
+        if i < window or not past:
+            n, nsd = weight, 0.
+        else:
+            d = [meas(bins[i], bins[j]) for j in past]
+            n, nsd = np.mean(d), np.std(d)
+        future = [j for j in range(i + 1, min(m, i + window + 1)) if counts[j]]
+        if future:
+            d = [meas(bins[i], bins[j]) for j in future]
+            t, tsd = np.mean(d), np.std(d)
+        else:
+            t, tsd = 0., 0.
+        if i >= m - window:
+            t = weight
+        r, rsd = n - t, (nsd + tsd) / 2
+        if i < window or i >= m - window:
+            r, rsd = weight, weight
+        for name, value in zip(SIGNALS, (n, nsd, t, tsd, r, rsd)):
+            signals[name][i] = value if counts[i] else np.nan
+    return bins, [start.isoformat() + "T00:00:00" for start in starts], counts, signals
+
+
+@pytest.mark.parametrize("meas", [kld, jsd])
+@pytest.mark.parametrize("unit, window", [("day", 1), ("day", 3), ("day", 5), ("week", 1), ("month", 1)])
+@pytest.mark.parametrize("weighted", [False, True])
+def test_calendar_matches_baseline(meas, unit, window, weighted):
+    dates = local_dates()
+    data = theta(len(dates), zeros=(3,))
+    lengths = None
+    if weighted:
+        lengths = np.random.RandomState(2).randint(0, 50, len(dates))
+    bins, starts, counts, expected = calendar_baseline(data, dates, unit, window, 0, meas, lengths=lengths)
+    # input in random order, as epoch seconds with offsets and as ISO strings
+    epoch, offsets = dates_to_epoch([date.isoformat() for date in dates], offsets=True)
+    for time, kwargs in ((epoch, dict(offsets=offsets)), (np.array([date.isoformat() for date in dates]), dict())):
+        idmdl = InfoDynamics(data, time, window=window, unit=unit, lengths=lengths, chunksize=4, **kwargs).fit(meas)
+        assert np.array_equal(idmdl.counts, counts)
+        assert np.allclose(idmdl.data, bins, equal_nan=True)
+        assert epoch_to_dates(idmdl.time, NAIVE) == starts
+        assert_signals(idmdl, expected)
+
+
+def test_calendar_local_days():
+    dates = local_dates()
+    epoch, offsets = dates_to_epoch([date.isoformat() for date in dates], offsets=True)
+    local = InfoDynamics(theta(len(dates)), epoch, window=3, unit="day", offsets=offsets)
+    utc = InfoDynamics(theta(len(dates)), epoch, window=3, unit="day")
+    # the documents just after local midnight fall on the next day in local time only
+    assert not np.array_equal(local.counts, utc.counts)
+    starts = epoch_to_dates(local.time, NAIVE)
+    counts = {day: local.counts[starts.index(day + "T00:00:00")] for day in ("2020-03-22", "2020-03-23", "2020-03-30")}
+    # the 30th has no documents but the one at 00:30 local time, which is still the 29th in UTC
+    assert counts == {"2020-03-22": 0, "2020-03-23": 0, "2020-03-30": 1}
+    assert utc.counts[epoch_to_dates(utc.time, NAIVE).index("2020-03-30T00:00:00")] == 0
@@ -0,0 +1,58 @@
+"""
+LatentSemantics fits, coherence scoring and k search on small synthetic corpora
+"""
+import numpy as np
+import pytest
+from gensim import corpora
+
+from tekisuto.models import LatentSemantics
+from tekisuto.models.coherence import CooccurrenceIndex, token_ids
+
+
+def texts(n=80, vocab=150, length=60, seed=11):
+    rng = np.random.RandomState(seed)
+    words = ["w{}".format(i) for i in range(vocab)]
+    return [[words[j] for j in rng.zipf(1.3, size=length) % vocab] for _ in range(n)]
+
+
+def test_hash_index_matches_doc2bow():
+    corpus = texts()
+    dictionary = corpora.HashDictionary(corpus, id_range=256, debug=False)
+    index = CooccurrenceIndex.build(corpus, dictionary)
+    # hashed ids need no stored words and agree with the bag-of-words corpus
+    assert token_ids(dictionary)(corpus[0]) == [dictionary.restricted_hash(token) for token in corpus[0]]
+    occurrences = index.count(np.arange(256), np.arange(256), window_size=None).diagonal()
+    dfs = np.zeros(256, dtype=np.int64)
+    for text in corpus:
+        dfs[[i for i, _ in dictionary.doc2bow(text)]] += 1
+    assert np.array_equal(occurrences, dfs)
+
+
+def test_fit_with_hashing():
+    ls = LatentSemantics(texts(), k=3, backend="lda", workers=1, passes=1)
+    ls.build_corpus(hashing=2 ** 10)
+    assert isinstance(ls.id2word, corpora.HashDictionary)
+    ls.fit()
+    assert np.isfinite(ls.coherence)
+    k, cohers = ls.coherence_k(krange=[2, 3], cores=1)
+    assert k in (2, 3) and np.all(np.isfinite(cohers))
+
+
+def test_fit_with_hash_vocabulary():
+    # no words are stored, topics are scored by their hashed ids
+    ls = LatentSemantics(texts(), k=3, backend="lda", workers=1, passes=1)
+    ls.build_corpus(vocabulary="hash", hashing=2 ** 9)
+    assert not ls.id2word.token2id
+    ls.fit()
+    assert np.isfinite(ls.coherence)
+    k, cohers = ls.coherence_k(krange=[2, 3], cores=1)
+    assert np.all(np.isfinite(cohers))
+
+
+def test_sketch_vocabulary_filters():
+    ls = LatentSemantics(texts(), k=3, backend="lda", workers=1)
+    exact = ls.generate_id2word(no_below=5, no_above=0.5)
+    sketch = ls.generate_id2word(no_below=5, no_above=0.5, vocabulary="sketch")
+    assert sketch.token2id.keys() == exact.token2id.keys()
+    with pytest.raises(ValueError):
+        ls.generate_id2word(vocabulary="sketch", hashing=2 ** 10)
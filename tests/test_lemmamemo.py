@@ -0,0 +1,55 @@
+"""
+LemmaMemo lookups and full-model failures
+"""
+from types import SimpleNamespace
+
+from tekisuto.preprocessing import lemmatizer
+from tekisuto.preprocessing.lemmamemo import LemmaMemo
+
+
+def full_model(failing=()):
+    """ pairs_batch that lemmatizes by upper-casing and fails on texts containing a failing form
+    """
+    def pairs_batch(texts):
+        return [None if any(form in text.split() for form in failing) else [(form, form.upper()) for form in text.split()]
+                for text in texts]
+    return pairs_batch
+
+
+def test_failed_documents_keep_their_forms():
+    memo = LemmaMemo(min_count=1)
+    out = memo.lemmatize(["a b", "c bad d"], full_model(failing=("bad",)))
+    assert out == ["A B", "c bad d"]
+    # nothing is learned from the failed document
+    assert "c" not in memo.table and "bad" not in memo.table
+
+
+def test_failed_isolated_forms_are_not_memoized():
+    memo = LemmaMemo(min_count=1, max_unknown=0.5)
+    memo.lemmatize(["a b c d"], full_model())
+    out = memo.lemmatize(["a b c bad"], full_model(failing=("bad",)))
+    assert out == ["A B C bad"]
+    assert "bad" not in memo.isolated
+    # a later run lemmatizes the form once the model succeeds
+    assert memo.lemmatize(["a b c bad"], full_model()) == ["A B C BAD"]
+    assert memo.isolated["bad"] == "BAD"
+
+
+class FakeStanza:
+    """ Stanza pipeline whose bulk_process fails and whose single calls fail on "bad"
+    """
+    def bulk_process(self, docs):
+        raise RuntimeError("batch failed")
+
+    def __call__(self, text):
+        if "bad" in text.split():
+            raise RuntimeError("document failed")
+        words = [SimpleNamespace(text=form, lemma=form.upper()) for form in text.split()]
+        return SimpleNamespace(sentences=[SimpleNamespace(words=words)])
+
+
+def test_failed_batch_is_retried_per_text(monkeypatch):
+    monkeypatch.setattr(lemmatizer.stanza, "Document", lambda words, text: text, raising=False)
+    le = lemmatizer.Lemmatizer.__new__(lemmatizer.Lemmatizer)
+    le.nlp, le.batch_size, le.memo = FakeStanza(), 32, None
+    assert le.pairs_batch(["a b", "bad", "c"]) == [[("a", "A"), ("b", "B")], None, [("c", "C")]]
@@ -0,0 +1,18 @@
+"""
+Core budget splitting
+"""
+import pytest
+
+from tekisuto.tekiutil import split_cores
+
+
+@pytest.mark.parametrize("cores, ntasks, inner", [(4, 10, 8), (4, 10, None), (8, 3, 2), (1, 5, 8), (16, 2, None), (6, 10, 4)])
+def test_split_cores_within_budget(cores, ntasks, inner):
+    outer, workers = split_cores(cores, ntasks, inner=inner)
+    assert 1 <= outer <= ntasks and workers >= 1
+    assert outer * workers <= cores
+
+
+def test_split_cores_caps_fixed_workers():
+    assert split_cores(4, 10, inner=8) == (1, 4)
+    assert split_cores(8, 10, inner=2) == (4, 2)
@@ -0,0 +1,22 @@
+"""
+TopicModel fits and coherence on a small synthetic corpus
+"""
+import numpy as np
+import pytest
+
+from tekisuto.models import TopicModel
+
+
+def texts(n=80, vocab=150, length=60, seed=13):
+    rng = np.random.RandomState(seed)
+    words = ["w{}".format(i) for i in range(vocab)]
+    return [[words[j] for j in rng.zipf(1.3, size=length) % vocab] for _ in range(n)]
+
+
+@pytest.mark.parametrize("vocabulary", ["exact", "hash"])
+def test_coherence(vocabulary):
+    tm = TopicModel(texts())
+    tm.fit(3, model="lda", bigrams=False, vocabulary=vocabulary, id_range=2 ** 9, passes=1)
+    assert np.isfinite(tm.get_coherence())
+    n, cohers = tm.tune_topic_range(ntopics=[2, 3], cores=1, model="lda", bigrams=False, vocabulary=vocabulary, id_range=2 ** 9, passes=1)
+    assert n in (2, 3) and np.all(np.isfinite(cohers))